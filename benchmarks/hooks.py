@@ -0,0 +1,72 @@
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+from contextlib import redirect_stdout
+
+# Measures what tracing hooks cost the tree-walker, on the given benchmarks:
+#
+#   python benchmarks/hooks.py [--runs 10] [name ...]
+#
+# 'none' never has a hook, 'removed' had one installed and removed again,
+# and 'no-op' runs with a hook that ignores every event. Without hooks an
+# interpreter is a plain Interpreter again, so 'removed' should match 'none'
+# to within noise.
+from run import HERE, available, DEFAULT_RUNS
+
+import cache
+import pylox
+from interpreter import Interpreter
+from tracing import Hook
+
+def no_hook(interpreter):
+    pass
+
+def removed_hook(interpreter):
+    hook = Hook()
+    interpreter.add_hook(hook)
+    interpreter.remove_hook(hook)
+    assert type(interpreter) is Interpreter
+
+def no_op_hook(interpreter):
+    interpreter.add_hook(Hook())
+
+VARIANTS = {"none": no_hook, "removed": removed_hook, "no-op": no_op_hook}
+
+def run_once(source, setup):
+    pylox.use_engine("tree")
+    setup(pylox.interpreter)
+    with redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        pylox.run(source)
+        return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(prog="benchmarks/hooks.py")
+    parser.add_argument("names", nargs="*", metavar="name", help="benchmarks to run (default: fib method_call zoo)")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help=f"timed runs of each variant (default: {DEFAULT_RUNS})")
+    args = parser.parse_args()
+    names = args.names or ["fib", "method_call", "zoo"]
+    unknown = sorted(set(names) - set(available()))
+    if unknown:
+        parser.error(f"no such benchmark: {', '.join(unknown)}")
+
+    cache.enabled = False
+    print(f"{'benchmark':<18} " + " ".join(f"{variant + ' s':>9}" for variant in VARIANTS) + f" {'disabled':>9}")
+    for name in names:
+        with open(os.path.join(HERE, name + ".lox")) as f:
+            source = f.read()
+        times = {variant: [] for variant in VARIANTS}
+        # Alternate the variants so that drift in the machine's speed hits
+        # them all alike
+        for _ in range(args.runs):
+            for variant, setup in VARIANTS.items():
+                times[variant].append(run_once(source, setup))
+        medians = {variant: statistics.median(runs) for variant, runs in times.items()}
+        disabled = medians["removed"] / medians["none"] - 1
+        print(f"{name:<18} " + " ".join(f"{median:>9.3f}" for median in medians.values()) + f" {disabled:>+9.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+# Runs the Lox programs in this directory through pylox.run and reports how
+# long they take and how much memory they use at peak:
+#
+#   python benchmarks/run.py [--engine vm] [--runs 5] [--output new.json]
+#                            [--baseline old.json] [name ...]
+#
+# With --baseline, each benchmark's median is compared with the saved one
+# and the exit status is 1 if any got slower by more than --threshold.
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "lox"))
+
+import cache
+import pylox
+
+DEFAULT_RUNS = 5
+DEFAULT_THRESHOLD = 0.10
+
+class BenchmarkError(Exception):
+    pass
+
+def available():
+    return sorted(name[:-len(".lox")] for name in os.listdir(HERE) if name.endswith(".lox"))
+
+# One run on a fresh interpreter; returns the time taken and what it printed.
+def run_once(engine, source):
+    pylox.use_engine(engine)
+    pylox.had_error = pylox.had_runtime_error = False
+    output = io.StringIO()
+    with redirect_stdout(output):
+        start = time.perf_counter()
+        pylox.run(source)
+        elapsed = time.perf_counter() - start
+    if pylox.had_error or pylox.had_runtime_error:
+        raise BenchmarkError("the program reported an error")
+    return elapsed, output.getvalue()
+
+def peak_memory(engine, source):
+    tracemalloc.start()
+    try:
+        run_once(engine, source)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def measure(engine, source, runs, warmup):
+    for _ in range(warmup):
+        run_once(engine, source)
+    times = []
+    for _ in range(runs):
+        elapsed, output = run_once(engine, source)
+        times.append(elapsed)
+    return {"runs": runs,
+            "median": statistics.median(times),
+            "min": min(times),
+            "stddev": statistics.stdev(times) if runs > 1 else 0.0,
+            "peak_memory": peak_memory(engine, source),
+            "output": output}
+
+# The relative change in each benchmark's median since the baseline.
+def compare(results, baseline):
+    changes = {}
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is not None:
+            if result["output"] != old["output"]:
+                raise BenchmarkError(f"{name} printed something other than in the baseline")
+            changes[name] = result["median"] / old["median"] - 1
+    return changes
+
+def print_table(results, changes, out):
+    out.write(f"{'benchmark':<18} {'median s':>9} {'min s':>9} {'stddev s':>9} {'peak KiB':>10} {'change':>8}\n")
+    for name, result in results.items():
+        change = f"{changes[name]:+.1%}" if name in changes else ""
+        out.write(f"{name:<18} {result['median']:>9.3f} {result['min']:>9.3f} {result['stddev']:>9.3f} "
+                  f"{result['peak_memory'] / 1024:>10.0f} {change:>8}\n")
+
+def main():
+    parser = argparse.ArgumentParser(prog="benchmarks/run.py")
+    parser.add_argument("names", nargs="*", metavar="name", help=f"benchmarks to run (default: all of {', '.join(available())})")
+    parser.add_argument("--engine", choices=sorted(pylox.ENGINES), default="tree")
+    parser.add_argument("--optimize", action="store_true", help="run the programs through the AST optimizer")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help=f"timed runs of each benchmark (default: {DEFAULT_RUNS})")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs before those (default: 1)")
+    parser.add_argument("--output", metavar="FILE", help="write the results as JSON, e.g. to use as a baseline later")
+    parser.add_argument("--baseline", metavar="FILE", help="compare with results saved by --output")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"slowdown of the median that counts as a regression (default: {DEFAULT_THRESHOLD})")
+    args = parser.parse_args()
+    names = args.names or available()
+    unknown = sorted(set(names) - set(available()))
+    if unknown:
+        parser.error(f"no such benchmark: {', '.join(unknown)}")
+    if args.runs < 1:
+        parser.error("--runs must be at least 1")
+
+    cache.enabled = False       # Every run scans, parses and compiles its program
+    pylox.optimize = args.optimize
+    results = {}
+    for name in names:
+        with open(os.path.join(HERE, name + ".lox")) as f:
+            source = f.read()
+        try:
+            results[name] = measure(args.engine, source, args.runs, args.warmup)
+        except BenchmarkError as error:
+            sys.exit(f"{name}: {error}")
+
+    changes = {}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline["engine"], baseline["optimize"]) != (args.engine, args.optimize):
+            sys.stderr.write(f"warning: the baseline was run with --engine={baseline['engine']}"
+                             f"{' --optimize' if baseline['optimize'] else ''}\n")
+        try:
+            changes = compare(results, baseline["benchmarks"])
+        except BenchmarkError as error:
+            sys.exit(str(error))
+    print_table(results, changes, sys.stdout)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"engine": args.engine, "optimize": args.optimize, "python": sys.version,
+                       "benchmarks": results}, f, indent=2)
+    regressions = [name for name, change in changes.items() if change > args.threshold]
+    if regressions:
+        print(f"\nslower than the baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,76 @@
+import argparse
 import sys
+import cache
 import pylox
+from vm import VM
+from sampler import Sampler, DEFAULT_INTERVAL, MIN_CHEAP_INTERVAL
 
 def main():
-    if len(sys.argv) > 2:
-        print("Usage: pylox [script]")
-        sys.exit(1)
-    elif len(sys.argv) == 2:
-        pylox.run_file(sys.argv[1])
-    else:
-        pylox.run_prompt()
+    parser = argparse.ArgumentParser(prog="pylox")
+    parser.add_argument("script", nargs="?")
+    parser.add_argument("--engine", choices=sorted(pylox.ENGINES), default="tree",
+                        help="execution engine (default: tree-walking interpreter)")
+    parser.add_argument("--scanner", choices=sorted(pylox.SCANNERS), default="regex",
+                        help="tokenizer (default: one master regular expression)")
+    parser.add_argument("--stream", action="store_true",
+                        help="execute each top-level declaration as soon as it is parsed")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="don't read or write compiled programs in the cache directory")
+    parser.add_argument("--optimize", action="store_true",
+                        help="fold constants, inline small functions, remove dead code and optimize loops before running")
+    parser.add_argument("--inline-budget", type=int, default=pylox.inline_budget, metavar="NODES",
+                        help="largest function body, in AST nodes, that --optimize inlines (0 disables inlining)")
+    parser.add_argument("--max-depth", type=int, default=VM.max_depth, metavar="CALLS",
+                        help="deepest call stack the vm engine allows before reporting a stack overflow")
+    parser.add_argument("--profile", action="store_true",
+                        help="time and count calls to each Lox function and runs of each line (tree engine only)")
+    parser.add_argument("--profile-output", default="lox-profile.json", metavar="FILE",
+                        help="where --profile writes its results as JSON (default: lox-profile.json)")
+    parser.add_argument("--sample", action="store_true",
+                        help="sample the Lox call stack while running and write it as folded stacks for flame graphs (tree engine only)")
+    parser.add_argument("--sample-output", default="lox-profile.folded", metavar="FILE",
+                        help="where --sample writes its folded stacks (default: lox-profile.folded)")
+    parser.add_argument("--sample-interval", type=float, default=DEFAULT_INTERVAL * 1000, metavar="MS",
+                        help=f"milliseconds between --sample samples (default: {DEFAULT_INTERVAL * 1000:g}); sampling costs 1-3%% "
+                             f"of run time at {MIN_CHEAP_INTERVAL * 1000:g} ms and more below it, and the rate actually reached is "
+                             "reported at exit")
+    parser.add_argument("--dump-ast", action="store_true",
+                        help="print the resolved (and optimized) program instead of running it")
+    args = parser.parse_args()
+    if args.profile and args.engine != "tree":
+        parser.error("--profile needs the tree engine")
+    if args.sample and args.engine != "tree":
+        parser.error("--sample needs the tree engine")
+    if args.sample_interval <= 0:
+        parser.error("--sample-interval must be more than 0")
+    if args.sample and args.sample_interval < MIN_CHEAP_INTERVAL * 1000:
+        sys.stderr.write(f"warning: sampling more often than every {MIN_CHEAP_INTERVAL * 1000:g} ms "
+                         "may slow the program down by more than 5%\n")
+    VM.max_depth = args.max_depth
+    pylox.use_engine(args.engine)
+    pylox.use_scanner(args.scanner)
+    cache.enabled = not args.no_cache
+    pylox.optimize = args.optimize
+    pylox.inline_budget = args.inline_budget
+    pylox.dump_ast = args.dump_ast
+    profiler = pylox.use_profiler() if args.profile else None
+    sampler = Sampler(args.sample_interval / 1000) if args.sample else None
+    if sampler is not None:
+        sampler.start()
+    try:
+        if args.script is not None:
+            pylox.run_file(args.script, args.stream)
+        else:
+            pylox.run_prompt()
+    finally:
+        if sampler is not None:
+            sampler.stop()
+            sampler.print_summary(sys.stderr)
+            sampler.write_folded(args.sample_output)
+        if profiler is not None:
+            profiler.finish()
+            profiler.print_table(sys.stderr)
+            profiler.write_json(args.profile_output)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
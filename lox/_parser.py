@@ -1,3 +1,4 @@
+from collections import deque
 from tkinter import LEFT, RIGHT
 from _token import *
 from expr import *
@@ -5,8 +6,11 @@ from stmt import *
 
 class Parser:
     def __init__(self, tokens):
-        self.tokens = tokens
-        self.current = 0
+        # tokens may be a list or a lazy stream ending in EOF; only the
+        # tokens looked ahead at are buffered.
+        self.tokens = iter(tokens)
+        self.lookahead = deque()
+        self.last = None
         self.found_expression = False
         self.allow_expression = False
         self.loop_depth = 0
@@ -23,10 +27,11 @@ class Parser:
         return statements
 
     def parse(self):
-        statements = []
+        return list(self.declarations())
+
+    def declarations(self):
         while not self.is_at_end():
-            statements.append(self.declaration())
-        return statements
+            yield self.declaration()
         
     def statement(self):
         if self.match(FOR):
@@ -185,7 +190,12 @@ class Parser:
                 parameters.append(self.consume(IDENTIFIER, "Expect parameter name"))
         self.consume(RIGHT_PAREN, "Expect ')' after parameters.")
         self.consume(LEFT_BRACE, "Expect '{' before " + kind + " body")
-        body = self.block()
+        enclosing_loop_depth = self.loop_depth
+        try:
+            self.loop_depth = 0     # 'break' can't cross a function boundary
+            body = self.block()
+        finally:
+            self.loop_depth = enclosing_loop_depth
         return FunctionExpression(parameters, body)
 
     def declaration(self):
@@ -319,22 +329,26 @@ class Parser:
     def check_next(self, type):
         if self.is_at_end():
             return False
-        if self.tokens[self.current + 1].type == EOF:
+        if len(self.lookahead) < 2:
+            self.lookahead.append(next(self.tokens))
+        if self.lookahead[1].type == EOF:
             return False
-        return self.tokens[self.current + 1].type == type
+        return self.lookahead[1].type == type
     
     def advance(self):
         if not self.is_at_end():
-            self.current += 1
+            self.last = self.lookahead.popleft()
         return self.previous()
     
     def is_at_end(self):
         return self.peek().type == EOF
     
     def peek(self):
-        return self.tokens[self.current]
+        if not self.lookahead:
+            self.lookahead.append(next(self.tokens))
+        return self.lookahead[0]
     def previous(self):
-        return self.tokens[self.current - 1]
+        return self.last
 
     def consume(self, type, message):
         if self.check(type):
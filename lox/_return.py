@@ -1,4 +1,8 @@
-class ReturnJmp(RuntimeError):
-    def __init__(self, value):
-        super().__init__()
-        self.value = value
\ No newline at end of file
+# Statements executed by the tree-walker complete with None when control
+# falls through to the next statement, BREAK to leave the innermost loop,
+# RETURN once the value being returned is in Interpreter.return_value, or
+# TAIL_CALL once the function and arguments of a call in tail position are
+# in Interpreter.tail_call, for the caller's LoxFunction.call to make.
+BREAK = object()
+RETURN = object()
+TAIL_CALL = object()
@@ -1,3 +1,4 @@
+import re
 import pylox
 
 (LEFT_PAREN, RIGHT_PAREN, LEFT_BRACE, RIGHT_BRACE, \
@@ -10,6 +11,8 @@ BANG, BANG_EQUAL,EQUAL, EQUAL_EQUAL, \
  EOF) = range(40)
 
 class Token:
+    __slots__ = ("type", "lexeme", "literal", "line")
+
     def __init__(self, type, lexeme, literal, line):
         self.type = type
         self.lexeme = lexeme
@@ -34,6 +37,12 @@ class Scanner:
             self.scan_token()
         self.tokens.append(Token(EOF,"",None,self.line))
         return self.tokens
+    def scan(self):
+        return iter(self.scan_tokens())
+
+    def scan_chunks(self, chunks):
+        self.source = "".join(chunks)
+        return self.scan()
     def is_at_end(self):
         return self.current >= len(self.source)
     def scan_token(self):
@@ -84,7 +93,7 @@ class Scanner:
             elif (c.isalpha()):
                 self.identifier()
             else:
-                pylox.error(self.line, f"Unexpected character: {c}")
+                pylox.report(self.line, "", f"Unexpected character: {c}")
 
 
     def advance(self):
@@ -116,7 +125,7 @@ class Scanner:
                 self.line += 1
             self.advance()
         if self.is_at_end():
-            pylox.error(self.line, "Unterminated string")
+            pylox.report(self.line, "", "Unterminated string")
             return
         self.advance()
         value = self.source[self.start + 1:self.current - 1]
@@ -138,3 +147,71 @@ class Scanner:
             token_type = IDENTIFIER
         self.add_token_single(token_type)
 
+PUNCTUATION = {"(": LEFT_PAREN, ")": RIGHT_PAREN, "{": LEFT_BRACE, "}": RIGHT_BRACE,
+    ",": COMMA, ".": DOT, "-": MINUS, "+": PLUS, ";": SEMICOLON, "/": SLASH, "*": STAR,
+    "!": BANG, "!=": BANG_EQUAL, "=": EQUAL, "==": EQUAL_EQUAL,
+    ">": GREATER, ">=": GREATER_EQUAL, "<": LESS, "<=": LESS_EQUAL}
+
+# One alternative per token class, tried in order; the same lexical rules as
+# Scanner.scan_token, including identifiers being letters and digits only.
+TOKEN_PATTERN = re.compile(r"""
+    (?P<identifier>[^\W\d_][^\W_]*)
+  | (?P<space>[ \r\t\n]+|//[^\n]*)
+  | (?P<punctuation>[!=<>]=?|[(){},.\-+;/*])
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<string>"[^"]*")
+  | (?P<unterminated>"[^"]*)
+  | (?P<unexpected>.)
+""", re.VERBOSE)
+
+class RegexScanner(Scanner):
+    # Matches whole tokens with TOKEN_PATTERN instead of stepping through
+    # characters, and yields them as they are found so the Parser can start
+    # before the source has been scanned to the end.
+    def scan_tokens(self):
+        self.tokens = list(self.scan())
+        return self.tokens
+
+    def scan(self):
+        return self.scan_chunks([self.source])
+
+    def scan_chunks(self, chunks):
+        self.line = 1
+        pending = ""
+        for chunk in chunks:
+            pending = yield from self.scan_text(pending + chunk, False)
+        yield from self.scan_text(pending, True)
+        yield Token(EOF, "", None, self.line)
+
+    # Scans as much of 'text' as can't be changed by what follows it and
+    # returns the rest. A token ending at, or one character before, the end
+    # of a chunk may continue into the next one ("1." + "5", "/" + "/").
+    def scan_text(self, text, final):
+        keywords = self.keywords
+        punctuation = PUNCTUATION
+        line = self.line
+        limit = len(text) - 1
+        for match in TOKEN_PATTERN.finditer(text):
+            if not final and match.end() >= limit:
+                self.line = line
+                return text[match.start():]
+            kind = match.lastgroup
+            lexeme = match.group()
+            if kind == "identifier":
+                yield Token(keywords.get(lexeme, IDENTIFIER), lexeme, None, line)
+            elif kind == "punctuation":
+                yield Token(punctuation[lexeme], lexeme, None, line)
+            elif kind == "space":
+                line += lexeme.count("\n")
+            elif kind == "number":
+                yield Token(NUMBER, lexeme, float(lexeme), line)
+            elif kind == "string":
+                line += lexeme.count("\n")
+                yield Token(STRING, lexeme, lexeme[1:-1], line)
+            elif kind == "unterminated":
+                line += lexeme.count("\n")
+                pylox.report(line, "", "Unterminated string")
+            else:
+                pylox.report(line, "", f"Unexpected character: {lexeme}")
+        self.line = line
+        return ""
@@ -1,33 +1,117 @@
 from expr import *
+from stmt import *
 from _token import Token, MINUS, STAR
 
 class AstPrinter(Visitor):
     def print(self, expr):
         return expr.accept(self)
 
+    def print_program(self, statements):
+        return "\n".join(self.print(statement) for statement in statements)
+
     def parenthesize(self, name, *args):
         string = ""
         string += "(" + name
         for arg in args:
             string += " "
-            string += arg.accept(self)
+            if isinstance(arg, str):
+                string += arg
+            else:
+                string += arg.accept(self)
         string += ")"
         return string
-    
+
+    def function(self, name, function):
+        params = "(" + " ".join(param.lexeme for param in function.params) + ")"
+        return self.parenthesize(name, params, *function.body)
+
+    def visitBlockStmt(self, stmt):
+        if stmt.unscoped:
+            return self.parenthesize("seq", *stmt.statements)
+        return self.parenthesize("block", *stmt.statements)
+
+    def visitClassStmt(self, stmt):
+        parts = [stmt.name.lexeme]
+        if stmt.superclass is not None:
+            parts += ["<", stmt.superclass.name.lexeme]
+        parts += [self.function("fun " + method.name.lexeme, method.function) for method in stmt.methods]
+        return self.parenthesize("class", *parts)
+
+    def visitBreakStmt(self, stmt):
+        return "(break)"
+
+    def visitExpressionStmt(self, stmt):
+        return self.parenthesize(";", stmt.expression)
+
+    def visitFunctionStmt(self, stmt):
+        return self.function("fun " + stmt.name.lexeme, stmt.function)
+
+    def visitIfStmt(self, stmt):
+        if stmt.else_branch is None:
+            return self.parenthesize("if", stmt.condition, stmt.then_branch)
+        return self.parenthesize("if", stmt.condition, stmt.then_branch, stmt.else_branch)
+
+    def visitPrintStmt(self, stmt):
+        return self.parenthesize("print", stmt.expression)
+
+    def visitReturnStmt(self, stmt):
+        if stmt.value is None:
+            return "(return)"
+        return self.parenthesize("return", stmt.value)
+
+    def visitVarStmt(self, stmt):
+        if stmt.initializer is None:
+            return self.parenthesize("var", stmt.name.lexeme)
+        return self.parenthesize("var", stmt.name.lexeme, stmt.initializer)
+
+    def visitWhileStmt(self, stmt):
+        return self.parenthesize("while", stmt.condition, stmt.body)
+
+    def visitAssignExpr(self, expr):
+        return self.parenthesize("=", expr.name.lexeme, expr.value)
+
     def visitBinaryExpr(self, expr):
         return self.parenthesize(expr.operator.lexeme, expr.left, expr.right)
-    
+
+    def visitCallExpr(self, expr):
+        return self.parenthesize("call", expr.callee, *expr.arguments)
+
+    def visitGetExpr(self, expr):
+        return self.parenthesize(".", expr.object, expr.name.lexeme)
+
+    def visitSetExpr(self, expr):
+        return self.parenthesize("=", self.visitGetExpr(expr), expr.value)
+
+    def visitSuperExpr(self, expr):
+        return "super." + expr.method.lexeme
+
+    def visitThisExpr(self, expr):
+        return "this"
+
     def visitGroupingExpr(self, expr):
         return self.parenthesize("group", expr.expression)
 
     def visitLiteralExpr(self, expr):
         if expr.value == None:
             return "nil"
+        if isinstance(expr.value, bool):
+            return "true" if expr.value else "false"
+        if isinstance(expr.value, str):
+            return '"' + expr.value + '"'
         return str(expr.value)
 
+    def visitLogicalExpr(self, expr):
+        return self.parenthesize(expr.operator.lexeme, expr.left, expr.right)
+
     def visitUnaryExpr(self,expr):
         return self.parenthesize(expr.operator.lexeme, expr.right)
 
+    def visitVariableExpr(self, expr):
+        return expr.name.lexeme
+
+    def visitFunctionExpressionExpr(self, expr):
+        return self.function("fun", expr)
+
 def main():
     expression = Binary(Unary(Token(MINUS, '-', None, 1), Literal(123)),
                             Token(STAR, "*", None, 1),
@@ -35,4 +119,4 @@ def main():
     print(AstPrinter().print(expression))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
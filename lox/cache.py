@@ -0,0 +1,92 @@
+import hashlib
+import importlib.util
+import os
+import sys
+
+# On-disk cache shared by the front end (resolved ASTs, .loxc) and the
+# Python engine (transpiled code, .loxpy). Entries are keyed by a hash of the
+# source and of the code that produced them, so editing the scanner, parser,
+# resolver or AST classes invalidates old entries automatically.
+FRONT_END = ("_token", "_parser", "resolver", "expr", "stmt")
+SUFFIXES = (".loxc", ".loxpy")
+DEFAULT_SIZE = 64 << 20
+
+enabled = True
+fingerprints = {}
+
+def cache_dir():
+    return os.environ.get("LOX_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "pylox")
+
+def cache_size():
+    try:
+        return int(os.environ.get("LOX_CACHE_SIZE", DEFAULT_SIZE))
+    except ValueError:
+        return DEFAULT_SIZE
+
+def fingerprint(modules):
+    if modules not in fingerprints:
+        digest = hashlib.sha256()
+        digest.update(importlib.util.MAGIC_NUMBER)
+        for name in modules:
+            with open(sys.modules[name].__file__, "rb") as f:
+                digest.update(f.read())
+        fingerprints[modules] = digest.digest()
+    return fingerprints[modules]
+
+def cache_key(source, *modules, options=""):
+    digest = hashlib.sha256()
+    digest.update(fingerprint(FRONT_END + modules))
+    digest.update(options.encode("utf-8"))
+    digest.update(source.encode("utf-8"))
+    return digest.hexdigest()
+
+def load(key, suffix, loader):
+    if not enabled:
+        return None
+    path = os.path.join(cache_dir(), key + suffix)
+    try:
+        with open(path, "rb") as f:
+            value = loader(f)
+        os.utime(path)      # Eviction drops the least recently used entries
+        return value
+    except Exception:
+        return None         # Missing, truncated or written by another version
+
+def store(key, suffix, dumper):
+    if not enabled:
+        return
+    directory = cache_dir()
+    path = os.path.join(directory, key + suffix)
+    temp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(temp, "wb") as f:
+            dumper(f)
+        os.replace(temp, path)
+    except (OSError, RecursionError, ValueError):
+        # Deeply nested programs can exceed the serializer's recursion limit
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        return
+    evict(directory, cache_size())
+
+def evict(directory, limit):
+    entries = []
+    try:
+        for entry in os.scandir(directory):
+            if entry.name.endswith(SUFFIXES):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
@@ -1,4 +1,4 @@
-from _return import ReturnJmp
+from _return import RETURN, TAIL_CALL
 from environment import Environment
 
 class LoxCallable:
@@ -12,18 +12,24 @@ class LoxFunction(LoxCallable):
         self.is_initializer = is_initializer
 
     def call(self, interpreter, arguments):
-        environment = Environment(self.closure)
-        for i in range(len(arguments)):
-            environment.define(self.declaration.params[i].lexeme, arguments[i])
-        try:
-            interpreter.execute_block(self.declaration.body, environment)
-        except ReturnJmp as r:
-            if self.is_initializer:
-                return self.closure.get_at(0, "this")
-            return r.value
-        if self.is_initializer:
-            return self.closure.get_at(0, "this")
-        return None
+        function = self
+        while True:
+            # Methods get 'this' in slot 0 of their frame, ahead of the parameters
+            environment = Environment(function.closure, arguments)
+            completion = interpreter.execute_block(function.declaration.body, environment)
+            if function.is_initializer:
+                return arguments[0]
+            if completion is RETURN:
+                return interpreter.return_value
+            if completion is not TAIL_CALL:
+                return None
+            # Make the tail call from this loop so that the Python stack
+            # doesn't grow with it
+            function, arguments = interpreter.tail_call
+            if type(function) is LoxBoundMethod:
+                function, arguments = function.method, [function.receiver] + arguments
+            if type(function) is not LoxFunction:
+                return function.call(interpreter, arguments)
 
     def arity(self):
         return len(self.declaration.params)
@@ -34,15 +40,30 @@ class LoxFunction(LoxCallable):
         return "<fn " + self.name + ">"
 
     def bind(self, instance, name):
-        environment = Environment(self.closure)
-        environment.define("this", instance)
-        return LoxFunction(name, self.declaration, environment, self.is_initializer)
+        return LoxBoundMethod(self, instance)
+
+class LoxBoundMethod(LoxCallable):
+    # A method read off an instance, e.g. 'var m = obj.method;'. Calls made
+    # straight on 'obj.method(...)' don't need one; see Interpreter.invoke.
+    def __init__(self, method, receiver):
+        self.method = method
+        self.receiver = receiver
+
+    def call(self, interpreter, arguments):
+        return self.method.call(interpreter, [self.receiver] + arguments)
+
+    def arity(self):
+        return self.method.arity()
+
+    def __str__(self):
+        return str(self.method)
 
 class LoxClass(LoxCallable):
     def __init__(self, name, superclass, methods):
         self.name = name
         self.methods = methods
         self.superclass = superclass
+        self.shape = Shape({})      # Every instance starts out with this one
     def __str__(self):
         return self.name
 
@@ -50,7 +71,7 @@ class LoxClass(LoxCallable):
         instance = LoxInstance(self)
         initializer = self.find_method("init")
         if initializer is not None:
-            initializer.bind(instance, "init").call(interpreter, arguments)
+            initializer.call(interpreter, [instance] + arguments)
         return instance
 
     def arity(self):
@@ -66,15 +87,37 @@ class LoxClass(LoxCallable):
             return self.superclass.find_method(name)
         return None
 
+class Shape:
+    # The layout shared by instances that got the same fields in the same
+    # order: field name -> index into LoxInstance.values. Adding a field
+    # moves an instance to the next shape, found through transitions.
+    __slots__ = ("index", "transitions")
+
+    def __init__(self, index):
+        self.index = index
+        self.transitions = {}
+
+    def add(self, name):
+        shape = self.transitions.get(name)
+        if shape is None:
+            index = dict(self.index)
+            index[name] = len(index)
+            shape = self.transitions[name] = Shape(index)
+        return shape
+
 class LoxInstance:
+    __slots__ = ("klass", "shape", "values")
+
     def __init__(self, klass):
         self.klass = klass
-        self.fields = {}
+        self.shape = klass.shape
+        self.values = []
     def __str__(self):
         return self.klass.name + " instance"
     def get(self,name):
-        if name.lexeme in self.fields:
-            return self.fields.get(name.lexeme)
+        offset = self.shape.index.get(name.lexeme)
+        if offset is not None:
+            return self.values[offset]
         method = self.klass.find_method(name.lexeme)
         if method is not None:
             return method.bind(self, name.lexeme)
@@ -82,5 +125,12 @@ class LoxInstance:
         raise LoxRuntimeError(name, f"Undefined property {name.lexeme}.")
 
     def set(self, name, value):
-        self.fields[name.lexeme] = value
-    
+        self.set_field(name.lexeme, value)
+
+    def set_field(self, name, value):
+        offset = self.shape.index.get(name)
+        if offset is None:
+            self.shape = self.shape.add(name)
+            self.values.append(value)
+        else:
+            self.values[offset] = value
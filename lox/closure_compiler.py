@@ -0,0 +1,539 @@
+import _token
+from expr import *
+from stmt import *
+from interpreter import Interpreter, LoxRuntimeError
+from callable import LoxCallable, LoxBoundMethod, LoxClass, LoxInstance
+from environment import Environment
+from vec import elementwise
+
+# Compiled statements return NORMAL when control falls through to the next
+# statement, BREAK to leave the innermost loop, and anything else is the
+# value of a 'return'.
+NORMAL = object()
+BREAK = object()
+
+class CompiledFunction(LoxCallable):
+    def __init__(self, name, params, body, closure, is_initializer):
+        self.name = name
+        self.params = params
+        self.body = body
+        self.closure = closure
+        self.is_initializer = is_initializer
+
+    def call(self, interpreter, arguments):
+        result = self.body(Environment(self.closure, arguments))
+        if self.is_initializer:
+            return arguments[0]
+        if result is NORMAL:
+            return None
+        return result
+
+    def arity(self):
+        return len(self.params)
+
+    def __str__(self):
+        if self.name is None:
+            return "<fn>"
+        return "<fn " + self.name + ">"
+
+    def bind(self, instance, name):
+        return LoxBoundMethod(self, instance)
+
+class ClosureCompiler(Visitor):
+    # Walks the resolved AST once and turns every node into a Python closure
+    # taking the current Environment. Operator choice, variable depth and
+    # arity are all decided here instead of on every evaluation.
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.globals = interpreter.globals
+        self.scope_depth = 0
+        self.function_depth = 0
+
+    def compile(self, statements):
+        return [self.compile_stmt(statement) for statement in statements]
+
+    def compile_stmt(self, stmt):
+        return stmt.accept(self)
+
+    def compile_expr(self, expr):
+        return expr.accept(self)
+
+    def compile_body(self, statements):
+        compiled = tuple(self.compile_stmt(statement) for statement in statements)
+        if len(compiled) == 1:
+            return compiled[0]
+        def body(env):
+            for statement in compiled:
+                result = statement(env)
+                if result is not NORMAL:
+                    return result
+            return NORMAL
+        return body
+
+    def compile_function(self, name, function, is_initializer):
+        params = tuple(param.lexeme for param in function.params)
+        enclosing_depth = self.scope_depth
+        self.scope_depth = 0
+        self.function_depth += 1
+        body = self.compile_body(function.body)
+        self.function_depth -= 1
+        self.scope_depth = enclosing_depth
+        def make(env):
+            return CompiledFunction(name, params, body, env, is_initializer)
+        return make
+
+    def is_global(self):
+        return self.scope_depth == 0 and self.function_depth == 0
+
+    def visitBlockStmt(self, stmt):
+        if stmt.unscoped:
+            return self.compile_body(stmt.statements)
+        self.scope_depth += 1
+        body = self.compile_body(stmt.statements)
+        self.scope_depth -= 1
+        def block(env):
+            return body(Environment(env))
+        return block
+
+    def visitClassStmt(self, stmt):
+        name = stmt.name
+        superclass_fn = None
+        if stmt.superclass is not None:
+            superclass_fn = self.compile_expr(stmt.superclass)
+        superclass_name = stmt.superclass.name if stmt.superclass is not None else None
+        methods = [(method.name.lexeme,
+                    self.compile_function(method.name.lexeme, method.function, method.name.lexeme == "init"))
+                   for method in stmt.methods]
+        is_global = self.is_global()
+        def klass(env):
+            superclass = None
+            if superclass_fn is not None:
+                superclass = superclass_fn(env)
+                if not isinstance(superclass, LoxClass):
+                    raise LoxRuntimeError(superclass_name, "Superclass must be a class.")
+            if is_global:
+                env.values[name.lexeme] = None
+            else:
+                env.values.append(None)
+            method_env = env
+            if superclass_fn is not None:
+                method_env = Environment(env, [superclass])
+            klass = LoxClass(name.lexeme, superclass,
+                             {method_name: make(method_env) for method_name, make in methods})
+            if is_global:
+                env.assign(name, klass)
+            else:
+                env.values[-1] = klass      # The class's own slot was the last defined
+            return NORMAL
+        return klass
+
+    def visitExpressionStmt(self, stmt):
+        expression = self.compile_expr(stmt.expression)
+        def statement(env):
+            expression(env)
+            return NORMAL
+        return statement
+
+    def visitFunctionStmt(self, stmt):
+        name = stmt.name.lexeme
+        make = self.compile_function(name, stmt.function, False)
+        if self.is_global():
+            def global_function(env):
+                env.values[name] = make(env)
+                return NORMAL
+            return global_function
+        def function(env):
+            env.values.append(make(env))
+            return NORMAL
+        return function
+
+    def visitFunctionExpressionExpr(self, expr):
+        return self.compile_function(None, expr, False)
+
+    def visitIfStmt(self, stmt):
+        condition = self.compile_expr(stmt.condition)
+        then_branch = self.compile_stmt(stmt.then_branch)
+        if stmt.else_branch is None:
+            def if_then(env):
+                value = condition(env)
+                if value is None or value is False:
+                    return NORMAL
+                return then_branch(env)
+            return if_then
+        else_branch = self.compile_stmt(stmt.else_branch)
+        def if_else(env):
+            value = condition(env)
+            if value is None or value is False:
+                return else_branch(env)
+            return then_branch(env)
+        return if_else
+
+    def visitPrintStmt(self, stmt):
+        expression = self.compile_expr(stmt.expression)
+        stringify = self.interpreter.stringify
+        def print_stmt(env):
+            print(stringify(expression(env)))
+            return NORMAL
+        return print_stmt
+
+    def visitReturnStmt(self, stmt):
+        if stmt.value is None:
+            return lambda env: None
+        return self.compile_expr(stmt.value)
+
+    def visitVarStmt(self, stmt):
+        name = stmt.name.lexeme
+        initializer = None
+        if stmt.initializer is not None:
+            initializer = self.compile_expr(stmt.initializer)
+        if self.is_global():
+            def define_global(env):
+                env.values[name] = initializer(env) if initializer is not None else None
+                return NORMAL
+            return define_global
+        if initializer is None:
+            def declare(env):
+                env.values.append(None)
+                return NORMAL
+            return declare
+        def define(env):
+            env.values.append(initializer(env))
+            return NORMAL
+        return define
+
+    def visitWhileStmt(self, stmt):
+        condition = self.compile_expr(stmt.condition)
+        body = self.compile_stmt(stmt.body)
+        def loop(env):
+            while True:
+                value = condition(env)
+                if value is None or value is False:
+                    return NORMAL
+                result = body(env)
+                if result is not NORMAL:
+                    if result is BREAK:
+                        return NORMAL
+                    return result
+        return loop
+
+    def visitBreakStmt(self, stmt):
+        return lambda env: BREAK
+
+    def visitAssignExpr(self, expr):
+        value = self.compile_expr(expr.value)
+        name = expr.name.lexeme
+        if expr.depth is None:
+            token = expr.name
+            global_values = self.globals.values
+            def assign_global(env):
+                result = value(env)
+                if name not in global_values:
+                    raise LoxRuntimeError(token, f"Undefined variable '{name}'.")
+                global_values[name] = result
+                return result
+            return assign_global
+        distance, slot = expr.depth, expr.slot
+        if distance == 0:
+            def assign_local(env):
+                result = env.values[slot] = value(env)
+                return result
+            return assign_local
+        def assign(env):
+            result = value(env)
+            for i in range(distance):
+                env = env.enclosing
+            env.values[slot] = result
+            return result
+        return assign
+
+    def visitLiteralExpr(self, expr):
+        value = expr.value
+        return lambda env: value
+
+    def visitLogicalExpr(self, expr):
+        left = self.compile_expr(expr.left)
+        right = self.compile_expr(expr.right)
+        if expr.operator.type == _token.OR:
+            def logical_or(env):
+                value = left(env)
+                if value is None or value is False:
+                    return right(env)
+                return value
+            return logical_or
+        def logical_and(env):
+            value = left(env)
+            if value is None or value is False:
+                return value
+            return right(env)
+        return logical_and
+
+    def visitSetExpr(self, expr):
+        obj_fn = self.compile_expr(expr.object)
+        value_fn = self.compile_expr(expr.value)
+        name = expr.name
+        interpreter = self.interpreter
+        def set_property(env):
+            obj = obj_fn(env)
+            if not isinstance(obj, LoxInstance):
+                raise LoxRuntimeError(name, "Only instances have fields.")
+            value = value_fn(env)
+            shape = obj.shape
+            if shape is not expr.cached_shape:
+                interpreter.cache_store(expr, shape)
+            if expr.cached_next is shape:
+                obj.values[expr.cached_offset] = value
+            else:
+                obj.shape = expr.cached_next
+                obj.values.append(value)
+            return value
+        return set_property
+
+    def visitSuperExpr(self, expr):
+        distance = expr.depth
+        method_name = expr.method
+        def super_method(env):
+            superclass = env.get_at(distance, 0)
+            obj = env.get_at(distance - 1, 0)
+            method = superclass.find_method(method_name.lexeme)
+            if method is None:
+                raise LoxRuntimeError(method_name, f"undefined property '{method_name.lexeme}'.")
+            return method.bind(obj, method_name.lexeme)
+        return super_method
+
+    def visitThisExpr(self, expr):
+        return self.variable(expr.keyword, expr)
+
+    def visitGroupingExpr(self, expr):
+        return self.compile_expr(expr.expression)
+
+    def visitUnaryExpr(self, expr):
+        right = self.compile_expr(expr.right)
+        operator = expr.operator
+        if operator.type == _token.MINUS:
+            def negate(env):
+                value = right(env)
+                if type(value) is not float:
+                    raise LoxRuntimeError(operator, "Operand must be a number")
+                return -value
+            return negate
+        def logical_not(env):
+            value = right(env)
+            return value is None or value is False
+        return logical_not
+
+    def visitVariableExpr(self, expr):
+        return self.variable(expr.name, expr)
+
+    def variable(self, name, expr):
+        lexeme = name.lexeme
+        if expr.depth is None:
+            global_values = self.globals.values
+            def global_variable(env):
+                try:
+                    return global_values[lexeme]
+                except KeyError:
+                    raise LoxRuntimeError(name, f"Undefined variable '{lexeme}'.")
+            return global_variable
+        distance, slot = expr.depth, expr.slot
+        if distance == 0:
+            return lambda env: env.values[slot]
+        if distance == 1:
+            return lambda env: env.enclosing.values[slot]
+        if distance == 2:
+            return lambda env: env.enclosing.enclosing.values[slot]
+        def local_variable(env):
+            for i in range(distance):
+                env = env.enclosing
+            return env.values[slot]
+        return local_variable
+
+    def visitBinaryExpr(self, expr):
+        left = self.compile_expr(expr.left)
+        right = self.compile_expr(expr.right)
+        operator = expr.operator
+        type_ = operator.type
+        if type_ == _token.PLUS:
+            def add(env):
+                a = left(env)
+                b = right(env)
+                if (type(a) is float and type(b) is float) or (type(a) is str and type(b) is str):
+                    return a + b
+                return elementwise("+", a, b, operator, "Operands must be two numbers or two strings")
+            return add
+        if type_ == _token.EQUAL_EQUAL:
+            return lambda env: left(env) == right(env)
+        if type_ == _token.BANG_EQUAL:
+            return lambda env: left(env) != right(env)
+        if type_ == _token.MINUS:
+            def subtract(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is float and type(b) is float:
+                    return a - b
+                return elementwise("-", a, b, operator, "Operands must be a number")
+            return subtract
+        if type_ == _token.STAR:
+            def multiply(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is float and type(b) is float:
+                    return a * b
+                return elementwise("*", a, b, operator, "Operands must be a number")
+            return multiply
+        if type_ == _token.SLASH:
+            def divide(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is float and type(b) is float:
+                    return a / b
+                return elementwise("/", a, b, operator, "Operands must be a number")
+            return divide
+        if type_ == _token.LESS:
+            def less(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is float and type(b) is float:
+                    return a < b
+                return elementwise("<", a, b, operator, "Operands must be a number")
+            return less
+        if type_ == _token.LESS_EQUAL:
+            def less_equal(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is float and type(b) is float:
+                    return a <= b
+                return elementwise("<=", a, b, operator, "Operands must be a number")
+            return less_equal
+        if type_ == _token.GREATER:
+            def greater(env):
+                a = left(env)
+                b = right(env)
+                if type(a) is float and type(b) is float:
+                    return a > b
+                return elementwise(">", a, b, operator, "Operands must be a number")
+            return greater
+        def greater_equal(env):
+            a = left(env)
+            b = right(env)
+            if type(a) is float and type(b) is float:
+                return a >= b
+            return elementwise(">=", a, b, operator, "Operands must be a number")
+        return greater_equal
+
+    def visitCallExpr(self, expr):
+        if type(expr.callee) is Get:
+            return self.invoke(expr, expr.callee)
+        callee_fn = self.compile_expr(expr.callee)
+        argument_fns = tuple(self.compile_expr(argument) for argument in expr.arguments)
+        paren = expr.paren
+        interpreter = self.interpreter
+        argc = len(argument_fns)
+        def call(env):
+            callee = callee_fn(env)
+            arguments = [argument(env) for argument in argument_fns]
+            if type(callee) is CompiledFunction:
+                if argc != len(callee.params):
+                    raise LoxRuntimeError(paren, f"Expected {len(callee.params)} arguments but got {argc}.")
+                result = callee.body(Environment(callee.closure, arguments))
+                if result is NORMAL:
+                    return None
+                return result
+            if not isinstance(callee, LoxCallable):
+                raise LoxRuntimeError(paren, "Can only call functions and classes")
+            if argc != callee.arity():
+                raise LoxRuntimeError(paren, f"Expected {callee.arity()} arguments but got {argc}.")
+            try:
+                return callee.call(interpreter, arguments)
+            except LoxRuntimeError as error:
+                if error.token is None:
+                    error.token = paren     # Raised by a native; see natives.error
+                raise
+        return call
+
+    def invoke(self, expr, get):
+        # obj.method(...) without a bound method; see Interpreter.invoke
+        obj_fn = self.compile_expr(get.object)
+        argument_fns = tuple(self.compile_expr(argument) for argument in expr.arguments)
+        name = get.name
+        lexeme = name.lexeme
+        paren = expr.paren
+        interpreter = self.interpreter
+        argc = len(argument_fns)
+        def invoke(env):
+            obj = obj_fn(env)
+            if not isinstance(obj, LoxInstance):
+                raise LoxRuntimeError(name, "Only  instances have properties.")
+            shape = obj.shape
+            if shape is not get.cached_shape:
+                get.cached_shape = shape
+                get.cached_offset = shape.index.get(lexeme)
+            if get.cached_offset is not None:
+                callee = obj.values[get.cached_offset]
+                arguments = [argument(env) for argument in argument_fns]
+                if not isinstance(callee, LoxCallable):
+                    raise LoxRuntimeError(paren, "Can only call functions and classes")
+                if argc != callee.arity():
+                    raise LoxRuntimeError(paren, f"Expected {callee.arity()} arguments but got {argc}.")
+                try:
+                    return callee.call(interpreter, arguments)
+                except LoxRuntimeError as error:
+                    if error.token is None:
+                        error.token = paren
+                    raise
+            if obj.klass is get.cached_class:
+                method = get.cached_method
+            else:
+                method = interpreter.find_method(get, obj.klass)
+            arguments = [obj]
+            for argument in argument_fns:
+                arguments.append(argument(env))
+            if argc != len(method.params):
+                raise LoxRuntimeError(paren, f"Expected {len(method.params)} arguments but got {argc}.")
+            result = method.body(Environment(method.closure, arguments))
+            if method.is_initializer:
+                return obj
+            if result is NORMAL:
+                return None
+            return result
+        return invoke
+
+    def visitGetExpr(self, expr):
+        obj_fn = self.compile_expr(expr.object)
+        name = expr.name
+        lexeme = name.lexeme
+        interpreter = self.interpreter
+        def get_property(env):
+            obj = obj_fn(env)
+            if not isinstance(obj, LoxInstance):
+                raise LoxRuntimeError(name, "Only  instances have properties.")
+            shape = obj.shape
+            if shape is not expr.cached_shape:
+                expr.cached_shape = shape
+                expr.cached_offset = shape.index.get(lexeme)
+            if expr.cached_offset is not None:
+                return obj.values[expr.cached_offset]
+            if obj.klass is expr.cached_class:
+                return expr.cached_method.bind(obj, lexeme)
+            return interpreter.find_method(expr, obj.klass).bind(obj, lexeme)
+        return get_property
+
+class ClosureInterpreter(Interpreter):
+    # Selectable alternative to the tree-walker: the resolved program is
+    # compiled to closures once and then run. Interpreter stays the reference.
+    def interpret(self, statements):
+        from pylox import runtimeError
+        compiled = ClosureCompiler(self).compile(statements)
+        try:
+            for statement in compiled:
+                statement(self.globals)
+        except LoxRuntimeError as error:
+            runtimeError(error)
+
+    def interpret_expr(self, expr):
+        compiled = ClosureCompiler(self).compile_expr(expr)
+        try:
+            return self.stringify(compiled(self.globals))
+        except LoxRuntimeError as error:
+            from pylox import runtimeError
+            runtimeError(error)
+            return None
@@ -0,0 +1,276 @@
+import _token
+from expr import *
+from stmt import *
+
+(OP_CONSTANT, OP_NIL, OP_TRUE, OP_FALSE, OP_POP,
+ OP_GET_LOCAL, OP_SET_LOCAL, OP_SET_LAST_LOCAL, OP_GET_GLOBAL, OP_SET_GLOBAL,
+ OP_DEFINE_LOCAL, OP_DEFINE_GLOBAL,
+ OP_GET_PROPERTY, OP_SET_PROPERTY, OP_CHECK_INSTANCE, OP_GET_SUPER,
+ OP_EQUAL, OP_NOT_EQUAL, OP_GREATER, OP_GREATER_EQUAL, OP_LESS, OP_LESS_EQUAL,
+ OP_ADD, OP_SUBTRACT, OP_MULTIPLY, OP_DIVIDE, OP_NOT, OP_NEGATE,
+ OP_PRINT, OP_JUMP, OP_JUMP_IF_FALSE, OP_JUMP_IF_TRUE, OP_POP_JUMP_IF_FALSE,
+ OP_CALL, OP_CLOSURE, OP_CLASS, OP_CHECK_SUPERCLASS,
+ OP_PUSH_SCOPE, OP_POP_SCOPE, OP_RETURN) = range(40)
+
+BINARY_OPS = {
+    _token.MINUS: OP_SUBTRACT, _token.PLUS: OP_ADD,
+    _token.SLASH: OP_DIVIDE, _token.STAR: OP_MULTIPLY,
+    _token.GREATER: OP_GREATER, _token.GREATER_EQUAL: OP_GREATER_EQUAL,
+    _token.LESS: OP_LESS, _token.LESS_EQUAL: OP_LESS_EQUAL,
+    _token.EQUAL_EQUAL: OP_EQUAL, _token.BANG_EQUAL: OP_NOT_EQUAL,
+}
+
+class Chunk:
+    # Operands are stored inline after their opcode; names, tokens and
+    # function prototypes live in the constant pool.
+    def __init__(self):
+        self.code = []
+        self.constants = []
+        self.constant_index = {}
+
+    def emit(self, *ops):
+        self.code.extend(ops)
+        return len(self.code) - 1
+
+    def add_constant(self, value):
+        if isinstance(value, (str, float)):
+            key = (type(value), value)
+            index = self.constant_index.get(key)
+            if index is None:
+                index = len(self.constants)
+                self.constants.append(value)
+                self.constant_index[key] = index
+            return index
+        self.constants.append(value)
+        return len(self.constants) - 1
+
+class FunctionProto:
+    def __init__(self, name, params, chunk):
+        self.name = name
+        self.params = params
+        self.arity = len(params)
+        self.chunk = chunk
+
+class Compiler(Visitor):
+    def __init__(self):
+        self.chunk = None
+        self.scope_depth = 0
+        self.function_depth = 0
+        self.loops = []
+
+    def compile(self, statements):
+        chunk = Chunk()
+        self.chunk = chunk
+        for statement in statements:
+            self.compile_stmt(statement)
+        chunk.emit(OP_NIL, OP_RETURN)
+        return FunctionProto(None, [], chunk)
+
+    def compile_expression(self, expr):
+        chunk = Chunk()
+        self.chunk = chunk
+        self.compile_expr(expr)
+        chunk.emit(OP_RETURN)
+        return FunctionProto(None, [], chunk)
+
+    def compile_function(self, name, function):
+        enclosing = (self.chunk, self.scope_depth, self.loops)
+        chunk = Chunk()
+        self.chunk, self.scope_depth, self.loops = chunk, 0, []
+        self.function_depth += 1
+        for statement in function.body:
+            self.compile_stmt(statement)
+        chunk.emit(OP_NIL, OP_RETURN)
+        self.function_depth -= 1
+        self.chunk, self.scope_depth, self.loops = enclosing
+        return FunctionProto(name, [param.lexeme for param in function.params], chunk)
+
+    def compile_stmt(self, stmt):
+        stmt.accept(self)
+
+    def compile_expr(self, expr):
+        expr.accept(self)
+
+    def emit(self, *ops):
+        return self.chunk.emit(*ops)
+
+    def constant(self, value):
+        return self.chunk.add_constant(value)
+
+    def define(self, name):
+        if self.scope_depth == 0 and self.function_depth == 0:
+            self.emit(OP_DEFINE_GLOBAL, self.constant(name))
+        else:
+            self.emit(OP_DEFINE_LOCAL)
+
+    def emit_jump(self, op):
+        return self.emit(op, -1)
+
+    def patch_jump(self, operand):
+        self.chunk.code[operand] = len(self.chunk.code)
+
+    def visitBlockStmt(self, stmt):
+        if stmt.unscoped:
+            for statement in stmt.statements:
+                self.compile_stmt(statement)
+            return
+        self.emit(OP_PUSH_SCOPE)
+        self.scope_depth += 1
+        for statement in stmt.statements:
+            self.compile_stmt(statement)
+        self.scope_depth -= 1
+        self.emit(OP_POP_SCOPE)
+
+    def visitClassStmt(self, stmt):
+        if stmt.superclass is not None:
+            self.compile_expr(stmt.superclass)
+            self.emit(OP_CHECK_SUPERCLASS, self.constant(stmt.superclass.name))
+        self.emit(OP_NIL)
+        self.define(stmt.name.lexeme)
+        if stmt.superclass is not None:
+            self.emit(OP_PUSH_SCOPE, OP_DEFINE_LOCAL)
+        for method in stmt.methods:
+            proto = self.compile_function(method.name.lexeme, method.function)
+            self.emit(OP_CLOSURE, self.constant(proto))
+        self.emit(OP_CLASS, self.constant(stmt.name.lexeme), len(stmt.methods),
+                  1 if stmt.superclass is not None else 0)
+        if stmt.superclass is not None:
+            self.emit(OP_POP_SCOPE)
+        if self.scope_depth == 0 and self.function_depth == 0:
+            self.emit(OP_SET_GLOBAL, self.constant(stmt.name), OP_POP)
+        else:
+            self.emit(OP_SET_LAST_LOCAL)
+
+    def visitExpressionStmt(self, stmt):
+        self.compile_expr(stmt.expression)
+        self.emit(OP_POP)
+
+    def visitFunctionStmt(self, stmt):
+        proto = self.compile_function(stmt.name.lexeme, stmt.function)
+        self.emit(OP_CLOSURE, self.constant(proto))
+        self.define(stmt.name.lexeme)
+
+    def visitFunctionExpressionExpr(self, expr):
+        proto = self.compile_function(None, expr)
+        self.emit(OP_CLOSURE, self.constant(proto))
+
+    def visitIfStmt(self, stmt):
+        self.compile_expr(stmt.condition)
+        else_jump = self.emit_jump(OP_POP_JUMP_IF_FALSE)
+        self.compile_stmt(stmt.then_branch)
+        if stmt.else_branch is not None:
+            end_jump = self.emit_jump(OP_JUMP)
+            self.patch_jump(else_jump)
+            self.compile_stmt(stmt.else_branch)
+            self.patch_jump(end_jump)
+        else:
+            self.patch_jump(else_jump)
+
+    def visitPrintStmt(self, stmt):
+        self.compile_expr(stmt.expression)
+        self.emit(OP_PRINT)
+
+    def visitReturnStmt(self, stmt):
+        if stmt.value is not None:
+            self.compile_expr(stmt.value)
+        else:
+            self.emit(OP_NIL)
+        self.emit(OP_RETURN)
+
+    def visitVarStmt(self, stmt):
+        if stmt.initializer is not None:
+            self.compile_expr(stmt.initializer)
+        else:
+            self.emit(OP_NIL)
+        self.define(stmt.name.lexeme)
+
+    def visitWhileStmt(self, stmt):
+        loop_start = len(self.chunk.code)
+        self.compile_expr(stmt.condition)
+        exit_jump = self.emit_jump(OP_POP_JUMP_IF_FALSE)
+        self.loops.append((self.scope_depth, []))
+        self.compile_stmt(stmt.body)
+        _, breaks = self.loops.pop()
+        self.emit(OP_JUMP, loop_start)
+        self.patch_jump(exit_jump)
+        for jump in breaks:
+            self.patch_jump(jump)
+
+    def visitBreakStmt(self, stmt):
+        depth, breaks = self.loops[-1]
+        for i in range(self.scope_depth - depth):
+            self.emit(OP_POP_SCOPE)
+        breaks.append(self.emit_jump(OP_JUMP))
+
+    def visitAssignExpr(self, expr):
+        self.compile_expr(expr.value)
+        if expr.depth is not None:
+            self.emit(OP_SET_LOCAL, expr.depth, expr.slot)
+        else:
+            self.emit(OP_SET_GLOBAL, self.constant(expr.name))
+
+    def visitLiteralExpr(self, expr):
+        if expr.value is None:
+            self.emit(OP_NIL)
+        elif expr.value is True:
+            self.emit(OP_TRUE)
+        elif expr.value is False:
+            self.emit(OP_FALSE)
+        else:
+            self.emit(OP_CONSTANT, self.constant(expr.value))
+
+    def visitLogicalExpr(self, expr):
+        self.compile_expr(expr.left)
+        if expr.operator.type == _token.OR:
+            end_jump = self.emit_jump(OP_JUMP_IF_TRUE)
+        else:
+            end_jump = self.emit_jump(OP_JUMP_IF_FALSE)
+        self.emit(OP_POP)
+        self.compile_expr(expr.right)
+        self.patch_jump(end_jump)
+
+    def visitSetExpr(self, expr):
+        self.compile_expr(expr.object)
+        self.emit(OP_CHECK_INSTANCE, self.constant(expr.name))
+        self.compile_expr(expr.value)
+        self.emit(OP_SET_PROPERTY, self.constant(expr.name))
+
+    def visitSuperExpr(self, expr):
+        self.emit(OP_GET_SUPER, expr.depth, self.constant(expr.method))
+
+    def visitThisExpr(self, expr):
+        self.variable(expr.keyword, expr)
+
+    def visitGroupingExpr(self, expr):
+        self.compile_expr(expr.expression)
+
+    def visitUnaryExpr(self, expr):
+        self.compile_expr(expr.right)
+        if expr.operator.type == _token.MINUS:
+            self.emit(OP_NEGATE, self.constant(expr.operator))
+        else:
+            self.emit(OP_NOT)
+
+    def visitVariableExpr(self, expr):
+        self.variable(expr.name, expr)
+
+    def variable(self, name, expr):
+        if expr.depth is not None:
+            self.emit(OP_GET_LOCAL, expr.depth, expr.slot)
+        else:
+            self.emit(OP_GET_GLOBAL, self.constant(name))
+
+    def visitBinaryExpr(self, expr):
+        self.compile_expr(expr.left)
+        self.compile_expr(expr.right)
+        self.emit(BINARY_OPS[expr.operator.type], self.constant(expr.operator))
+
+    def visitCallExpr(self, expr):
+        self.compile_expr(expr.callee)
+        for argument in expr.arguments:
+            self.compile_expr(argument)
+        self.emit(OP_CALL, len(expr.arguments), self.constant(expr.paren))
+
+    def visitGetExpr(self, expr):
+        self.compile_expr(expr.object)
+        self.emit(OP_GET_PROPERTY, self.constant(expr.name))
@@ -1,13 +1,17 @@
 class Environment:
-    def __init__(self, enclosing = None):
-        self.values = {}
+    # A local scope. The Resolver gives every local a slot (its declaration
+    # order within the scope), so values are a plain list indexed by slot.
+    __slots__ = ("values", "enclosing")
+
+    def __init__(self, enclosing = None, values = None):
+        self.values = [] if values is None else values
         self.enclosing = enclosing
-    
-    def define(self, name, value):
-        self.values[name] = value
 
-    def get_at(self, dist, name):
-        return self.ancestor(dist).values[name]
+    def define(self, value):
+        self.values.append(value)
+
+    def get_at(self, dist, slot):
+        return self.ancestor(dist).values[slot]
 
     def ancestor(self, dist):
         environment = self
@@ -15,25 +19,30 @@ class Environment:
             environment = environment.enclosing
         return environment
 
+    def assign_at(self, dist, slot, value):
+        self.ancestor(dist).values[slot] = value
+
+class GlobalEnvironment:
+    # Globals are late bound, so they stay keyed by name.
+    __slots__ = ("values",)
+
+    def __init__(self):
+        self.values = {}
+
+    def define(self, name, value):
+        self.values[name] = value
+
     def get(self, name):
-        if name.lexeme in self.values.keys():
+        if name.lexeme in self.values:
             return self.values[name.lexeme]
-        if self.enclosing is not None:
-            return self.enclosing.get(name)
-        
+
         from interpreter import LoxRuntimeError
         raise LoxRuntimeError(name, f"Undefined variable '{name.lexeme}'.")
 
-    def assign_at(self, dist, name, value):
-        self.ancestor(dist).values[name.lexeme] = value
-
     def assign(self, name, value):
-        if name.lexeme in self.values.keys():
+        if name.lexeme in self.values:
             self.values[name.lexeme] = value
             return
-        if self.enclosing is not None:
-            self.enclosing.assign(name, value)
-            return
-        
+
         from interpreter import LoxRuntimeError
-        raise LoxRuntimeError(name, f"Undefined variable '{name.lexeme}'.")
\ No newline at end of file
+        raise LoxRuntimeError(name, f"Undefined variable '{name.lexeme}'.")
@@ -1,17 +1,23 @@
 class Expr:
-	pass
+	__slots__ = ()
 
 class Visitor:
-	pass
+	__slots__ = ()
 class Assign(Expr):
+	__slots__ = ("name", "value", "depth", "slot")
+
 	def __init__(self,name,value):
 		self.name = name
 		self.value = value
+		self.depth = None
+		self.slot = None
 
 	def accept(self, visitor):
 		return visitor.visitAssignExpr(self)
 
 class Binary(Expr):
+	__slots__ = ("left", "operator", "right")
+
 	def __init__(self,left,operator,right):
 		self.left = left
 		self.operator = operator
@@ -21,6 +27,8 @@ class Binary(Expr):
 		return visitor.visitBinaryExpr(self)
 
 class Call(Expr):
+	__slots__ = ("callee", "paren", "arguments")
+
 	def __init__(self,callee,paren,arguments):
 		self.callee = callee
 		self.paren = paren
@@ -30,38 +38,60 @@ class Call(Expr):
 		return visitor.visitCallExpr(self)
 
 class Get(Expr):
+	__slots__ = ("object", "name", "cached_shape", "cached_offset", "cached_class", "cached_method", "cache")
+
 	def __init__(self,object,name):
 		self.object = object
 		self.name = name
+		self.cached_shape = None
+		self.cached_offset = None
+		self.cached_class = None
+		self.cached_method = None
+		self.cache = None
 
 	def accept(self, visitor):
 		return visitor.visitGetExpr(self)
 
 class Set(Expr):
+	__slots__ = ("object", "name", "value", "cached_shape", "cached_offset", "cached_next")
+
 	def __init__(self,object,name,value):
 		self.object = object
 		self.name = name
 		self.value = value
+		self.cached_shape = None
+		self.cached_offset = None
+		self.cached_next = None
 
 	def accept(self, visitor):
 		return visitor.visitSetExpr(self)
 
 class Super(Expr):
+	__slots__ = ("keyword", "method", "depth", "slot")
+
 	def __init__(self,keyword,method):
 		self.keyword = keyword
 		self.method = method
+		self.depth = None
+		self.slot = None
 
 	def accept(self, visitor):
 		return visitor.visitSuperExpr(self)
 
 class This(Expr):
+	__slots__ = ("keyword", "depth", "slot")
+
 	def __init__(self,keyword):
 		self.keyword = keyword
+		self.depth = None
+		self.slot = None
 
 	def accept(self, visitor):
 		return visitor.visitThisExpr(self)
 
 class Grouping(Expr):
+	__slots__ = ("expression",)
+
 	def __init__(self,expression):
 		self.expression = expression
 
@@ -69,6 +99,8 @@ class Grouping(Expr):
 		return visitor.visitGroupingExpr(self)
 
 class Literal(Expr):
+	__slots__ = ("value",)
+
 	def __init__(self,value):
 		self.value = value
 
@@ -76,6 +108,8 @@ class Literal(Expr):
 		return visitor.visitLiteralExpr(self)
 
 class Logical(Expr):
+	__slots__ = ("left", "operator", "right")
+
 	def __init__(self,left,operator,right):
 		self.left = left
 		self.operator = operator
@@ -85,6 +119,8 @@ class Logical(Expr):
 		return visitor.visitLogicalExpr(self)
 
 class Unary(Expr):
+	__slots__ = ("operator", "right")
+
 	def __init__(self,operator,right):
 		self.operator = operator
 		self.right = right
@@ -93,13 +129,19 @@ class Unary(Expr):
 		return visitor.visitUnaryExpr(self)
 
 class Variable(Expr):
+	__slots__ = ("name", "depth", "slot")
+
 	def __init__(self,name):
 		self.name = name
+		self.depth = None
+		self.slot = None
 
 	def accept(self, visitor):
 		return visitor.visitVariableExpr(self)
 
 class FunctionExpression(Expr):
+	__slots__ = ("params", "body")
+
 	def __init__(self,params,body):
 		self.params = params
 		self.body = body
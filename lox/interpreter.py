@@ -3,28 +3,57 @@ from stmt import *
 from expr import *
 from callable import LoxCallable, LoxFunction, LoxClass, LoxInstance
 import _token
-from environment import Environment
-from _return import ReturnJmp
-import time
+from environment import Environment, GlobalEnvironment
+from _return import BREAK, RETURN, TAIL_CALL
+from natives import NATIVES, NativeFunction
+from vec import elementwise
+
+POLYMORPHIC_LIMIT = 8
 
 class Interpreter(Visitor):
+    # No __dict__, so that add_hook can change an interpreter's class without
+    # making CPython fall back to slower attribute reads on it.
+    __slots__ = ("globals", "environment", "return_value", "tail_call", "hooks", "statement_lines", "functions")
+
     def __init__(self):
-        self.globals = Environment()
+        self.globals = GlobalEnvironment()
         self.environment = self.globals
-        self.locals = {}
-        Clock = LoxCallable
-        Clock.arity = lambda : 0
-        Clock.call = lambda interpreter, arguments: float(time.time())
-        Clock.__str__ = lambda : "<native fn>"
-        self.globals.define("clock", Clock)
+        self.return_value = None
+        self.tail_call = None
+        for name, function in NATIVES.items():
+            self.globals.define(name, function)
 
     def interpret(self, statements):
-        from pylox import runtimeError
         try:
             for statement in statements:
                 self.execute(statement)
         except LoxRuntimeError as error: 
-            runtimeError(error)
+            self.runtime_error(error)
+
+    def runtime_error(self, error):
+        from pylox import runtimeError
+        runtimeError(error)
+
+    # Tracing hooks (see tracing.Hook) are called by tracing.TracingInterpreter.
+    # The first hook switches this interpreter to that class, so running
+    # without hooks costs nothing.
+    def add_hook(self, hook):
+        from tracing import TracingInterpreter
+        if type(self) is not Interpreter:
+            raise TypeError(f"{type(self).__name__} doesn't support tracing hooks")
+        self.__class__ = TracingInterpreter
+        self.hooks = [hook]
+        self.statement_lines = {}
+        self.functions = []     # The LoxFunctions being called, innermost last
+
+    def remove_hook(self, hook):
+        raise ValueError("hook not installed")
+
+    # Engines that keep compiled programs on disk override this to run a
+    # cached copy of 'source' without scanning, parsing or resolving it.
+    # 'options' names the optimizations the copy must have been built with.
+    def run_cached(self, source, options):
+        return False
 
     # For the "shell-like" interpreter
     def interpret_expr(self, expr):
@@ -32,41 +61,49 @@ class Interpreter(Visitor):
             value = self.evaluate(expr)
             return self.stringify(value)
         except LoxRuntimeError as error:
-            from pylox import runtimeError
-            runtimeError(error)
+            self.runtime_error(error)
             return None
 
     def evaluate(self, expr):
         return expr.accept(self)
     
     def execute(self, stmt):
-        stmt.accept(self)
+        return stmt.accept(self)
 
-    def resolve(self, expr, depth):
-        self.locals[expr] = depth
+    def resolve(self, expr, depth, slot):
+        # Resolution lives on the node itself; unresolved nodes are globals
+        expr.depth = depth
+        expr.slot = slot
+
+    def declare(self, name, value):
+        if self.environment is self.globals:
+            self.globals.define(name, value)
+        else:
+            self.environment.define(value)
 
     def execute_block(self, statements, environment):
         previous = self.environment
         try:
             self.environment = environment
             for statement in statements:
-                self.execute(statement)
+                completion = statement.accept(self)
+                if completion is not None:
+                    return completion
         finally:
             self.environment = previous
+        return None
 
     def stringify(self, ob):
-        if ob is None:
-            return "nil"
-        if isinstance(ob, float):
-            text = str(ob)
-            if text.endswith('.0'):
-                text = text[:-2]
-            return text
-        return str(ob)
+        return stringify(ob)
 
     def visitBlockStmt(self,stmt):
-        self.execute_block(stmt.statements, Environment(self.environment))
-        return None
+        if stmt.unscoped:
+            for statement in stmt.statements:
+                completion = statement.accept(self)
+                if completion is not None:
+                    return completion
+            return None
+        return self.execute_block(stmt.statements, Environment(self.environment))
 
     def visitClassStmt(self, stmt):
         superclass = None
@@ -74,19 +111,21 @@ class Interpreter(Visitor):
             superclass = self.evaluate(stmt.superclass)
             if not isinstance(superclass, LoxClass):
                 raise LoxRuntimeError(stmt.superclass.name, "Superclass must be a class.")
-        self.environment.define(stmt.name.lexeme, None)
+        self.declare(stmt.name.lexeme, None)
         if stmt.superclass is not None:
-            self.environment = Environment(self.environment)
-            self.environment.define("super", superclass)
+            self.environment = Environment(self.environment, [superclass])
 
         methods = {}
         for method in stmt.methods:
-            fn = LoxFunction(method.name, method.function, self.environment, method.name.lexeme == "init")
+            fn = LoxFunction(method.name.lexeme, method.function, self.environment, method.name.lexeme == "init")
             methods[method.name.lexeme] = fn
         klass = LoxClass(stmt.name.lexeme, superclass, methods)
         if superclass is not None:
             self.environment = self.environment.enclosing
-        self.environment.assign(stmt.name, klass)
+        if self.environment is self.globals:
+            self.globals.assign(stmt.name, klass)
+        else:
+            self.environment.values[-1] = klass     # The class's own slot was the last defined
         return None
 
     def visitExpressionStmt(self,stmt):
@@ -95,7 +134,7 @@ class Interpreter(Visitor):
 
     def visitFunctionStmt(self, stmt):
         fn_name = stmt.name.lexeme
-        self.environment.define(fn_name, LoxFunction(fn_name, stmt.function, self.environment, False))
+        self.declare(fn_name, LoxFunction(fn_name, stmt.function, self.environment, False))
         return None
     
     def visitFunctionExpressionExpr(self, expr):      # Allow Lambdas
@@ -103,9 +142,9 @@ class Interpreter(Visitor):
 
     def visitIfStmt(self, stmt):
         if self.is_truthy(self.evaluate(stmt.condition)):
-            self.execute(stmt.then_branch)
+            return self.execute(stmt.then_branch)
         elif stmt.else_branch is not None:
-            self.execute(stmt.else_branch)
+            return self.execute(stmt.else_branch)
         return None
 
     def visitPrintStmt(self, stmt):
@@ -114,34 +153,48 @@ class Interpreter(Visitor):
         return None
 
     def visitReturnStmt(self, stmt):
+        if stmt.tail:
+            callee, arguments = self.tail_call = self.prepare_call(stmt.value)
+            if type(callee) is not NativeFunction:
+                return TAIL_CALL
+            # Natives don't recurse, and called here their errors are
+            # reported at this call
+            self.return_value = self.call_native(stmt.value, callee, arguments)
+            return RETURN
         value = None
         if stmt.value is not None:
             value = self.evaluate(stmt.value)
-        raise ReturnJmp(value)
+        self.return_value = value
+        return RETURN
 
     def visitVarStmt(self, stmt):
         value = None
         if stmt.initializer != None:
             value = self.evaluate(stmt.initializer)
-        self.environment.define(stmt.name.lexeme, value)
+        self.declare(stmt.name.lexeme, value)
         return None
 
     def visitWhileStmt(self, stmt):
-        try:
-            while(self.is_truthy(self.evaluate(stmt.condition))):
-                self.execute(stmt.body)
-        except BreakException:
-            pass
+        while(self.is_truthy(self.evaluate(stmt.condition))):
+            completion = self.execute(stmt.body)
+            if completion is not None:
+                if completion is BREAK:
+                    break
+                return completion
         return None
 
     def visitBreakStmt(self, stmt):
-        raise BreakException()
+        return BREAK
 
     def visitAssignExpr(self, expr):
         value = self.evaluate(expr.value)
-        distance = self.locals.get(expr)
-        if distance is not None:
-            self.environment.assign_at(distance, expr.name, value)
+        depth = expr.depth
+        if depth is not None:
+            environment = self.environment
+            while depth:
+                environment = environment.enclosing
+                depth -= 1
+            environment.values[expr.slot] = value
         else:
             self.globals.assign(expr.name, value)
         return value
@@ -164,13 +217,31 @@ class Interpreter(Visitor):
         if not isinstance(obj, LoxInstance):
             raise LoxRuntimeError(expr.name, "Only instances have fields.")
         value = self.evaluate(expr.value)
-        obj.set(expr.name, value)
+        shape = obj.shape
+        if shape is not expr.cached_shape:
+            self.cache_store(expr, shape)
+        if expr.cached_next is shape:
+            obj.values[expr.cached_offset] = value
+        else:
+            obj.shape = expr.cached_next
+            obj.values.append(value)
         return value
 
+    # Field stores cache the shape they last saw: either the field's offset
+    # in it, or the shape an instance moves to when the field is added.
+    def cache_store(self, expr, shape):
+        offset = shape.index.get(expr.name.lexeme)
+        expr.cached_shape = shape
+        if offset is None:
+            expr.cached_next = shape.add(expr.name.lexeme)
+        else:
+            expr.cached_next = shape
+            expr.cached_offset = offset
+
     def visitSuperExpr(self, expr):
-        distance = self.locals.get(expr)
-        superclass = self.environment.get_at(distance, "super")
-        object = self.environment.get_at(distance - 1, "this")
+        distance = expr.depth
+        superclass = self.environment.get_at(distance, 0)
+        object = self.environment.get_at(distance - 1, 0)
         method = superclass.find_method(expr.method.lexeme)
         if method is None:
             raise LoxRuntimeError(expr.method, f"undefined property '{expr.method.lexeme}'.")
@@ -186,7 +257,7 @@ class Interpreter(Visitor):
         right = self.evaluate(expr.right)
         type = expr.operator.type
         if type == _token.MINUS:
-            self.check_number_operand(type, right)
+            self.check_number_operand(expr.operator, right)
             return -float(right)
         elif type == _token.BANG:
             return not self.is_truthy(right)
@@ -196,9 +267,13 @@ class Interpreter(Visitor):
         return self.look_up_variable(expr.name, expr)
 
     def look_up_variable(self, name, expr):
-        distance = self.locals.get(expr, None)
-        if distance is not None:
-            return self.environment.get_at(distance, name.lexeme)
+        depth = expr.depth
+        if depth is not None:
+            environment = self.environment
+            while depth:
+                environment = environment.enclosing
+                depth -= 1
+            return environment.values[expr.slot]
         else:
             return self.globals.get(name)
 
@@ -207,53 +282,148 @@ class Interpreter(Visitor):
         right = self.evaluate(expr.right)
         type = expr.operator.type
         if type == _token.MINUS:
-            self.check_number_operands(type, left, right)
-            return float(left) - float(right)
+            if isinstance(left, float) and isinstance(right, float):
+                return left - right
+            return elementwise("-", left, right, expr.operator, "Operands must be a number")
         elif type == _token.PLUS:
             if isinstance(left, float) and isinstance(right, float):
-                return float(left) + float(right)
+                return left + right
             if isinstance(left, str) and isinstance(right, str):
-                return str(left) + str(right)
-            raise LoxRuntimeError(type, "Operands must be two numbers or two strings")
+                return left + right
+            return elementwise("+", left, right, expr.operator, "Operands must be two numbers or two strings")
         elif type == _token.SLASH:
-            self.check_number_operands(type, left, right)
-            return float(left) / float(right)
+            if isinstance(left, float) and isinstance(right, float):
+                return left / right
+            return elementwise("/", left, right, expr.operator, "Operands must be a number")
         elif type == _token.STAR:
-            self.check_number_operands(type, left, right)
-            return float(left) * float(right)
+            if isinstance(left, float) and isinstance(right, float):
+                return left * right
+            return elementwise("*", left, right, expr.operator, "Operands must be a number")
         elif type == _token.GREATER:
-            self.check_number_operands(type, left, right)
-            return float(left) > float(right)
+            if isinstance(left, float) and isinstance(right, float):
+                return left > right
+            return elementwise(">", left, right, expr.operator, "Operands must be a number")
         elif type == _token.GREATER_EQUAL:
-            self.check_number_operands(type, left, right)
-            return float(left) >= float(right)
+            if isinstance(left, float) and isinstance(right, float):
+                return left >= right
+            return elementwise(">=", left, right, expr.operator, "Operands must be a number")
         elif type == _token.LESS:
-            self.check_number_operands(type, left, right)
-            return float(left) < float(right)
+            if isinstance(left, float) and isinstance(right, float):
+                return left < right
+            return elementwise("<", left, right, expr.operator, "Operands must be a number")
         elif type == _token.LESS_EQUAL:
-            self.check_number_operands(type, left, right)
-            return float(left) <= float(right)
+            if isinstance(left, float) and isinstance(right, float):
+                return left <= right
+            return elementwise("<=", left, right, expr.operator, "Operands must be a number")
         elif type == _token.EQUAL_EQUAL:
             return self.is_equal(left, right)
         elif type == _token.BANG_EQUAL:
             return not self.is_equal(left, right)
 
     def visitCallExpr(self, expr):
+        callee, arguments = self.prepare_call(expr)
+        try:
+            return callee.call(self, arguments)
+        except LoxRuntimeError as error:
+            if error.token is None:
+                error.token = expr.paren    # Raised by a native; see natives.error
+            raise
+
+    def call_native(self, expr, native, arguments):
+        try:
+            return native.call(self, arguments)
+        except LoxRuntimeError as error:
+            if error.token is None:
+                error.token = expr.paren
+            raise
+
+    # Evaluates the callee and arguments of a call and checks them, without
+    # making the call: returns what to call and the arguments to pass.
+    def prepare_call(self, expr):
+        if type(expr.callee) is Get:
+            return self.invoke(expr, expr.callee)
         callee = self.evaluate(expr.callee)
         arguments = []
         for argument in expr.arguments:
             arguments.append(self.evaluate(argument))
+        return self.check_call(expr, callee, arguments)
+
+    # obj.method(...) calls the method with obj in slot 0 of its frame
+    # instead of binding it first. Fields can hold any callable, so they
+    # take the general path.
+    def invoke(self, expr, get):
+        object = self.evaluate(get.object)
+        if not isinstance(object, LoxInstance):
+            raise LoxRuntimeError(get.name, "Only  instances have properties.")
+        shape = object.shape
+        if shape is not get.cached_shape:
+            get.cached_shape = shape
+            get.cached_offset = shape.index.get(get.name.lexeme)
+        if get.cached_offset is not None:
+            callee = object.values[get.cached_offset]     # Before the arguments, which may assign it
+            arguments = []
+            for argument in expr.arguments:
+                arguments.append(self.evaluate(argument))
+            return self.check_call(expr, callee, arguments)
+        if object.klass is get.cached_class:
+            method = get.cached_method
+        else:
+            method = self.find_method(get, object.klass)
+        arguments = [object]
+        for argument in expr.arguments:
+            arguments.append(self.evaluate(argument))
+        if len(expr.arguments) != method.arity():
+            raise LoxRuntimeError(expr.paren, f"Expected {method.arity()} arguments but got {len(expr.arguments)}.")
+        return method, arguments
+
+    # Calls a Lox value for a native, such as sort's comparator. Errors
+    # without a token are reported at the native's call.
+    def apply(self, callee, arguments):
+        if not isinstance(callee, LoxCallable):
+            raise LoxRuntimeError(None, "Can only call functions and classes")
+        if len(arguments) != callee.arity():
+            raise LoxRuntimeError(None, f"Expected {callee.arity()} arguments but got {len(arguments)}.")
+        return callee.call(self, arguments)
+
+    def check_call(self, expr, callee, arguments):
         if not isinstance(callee, LoxCallable):
             raise LoxRuntimeError(expr.paren, "Can only call functions and classes")
         if len(arguments) != callee.arity():
             raise LoxRuntimeError(expr.paren, f"Expected {callee.arity()} arguments but got {len(arguments)}.")
-        return callee.call(self, arguments)
+        return callee, arguments
 
     def visitGetExpr(self, expr):
         object = self.evaluate(expr.object)
-        if isinstance(object, LoxInstance):
-            return object.get(expr.name)
-        raise LoxRuntimeError(expr.name, "Only  instances have properties.")    
+        if not isinstance(object, LoxInstance):
+            raise LoxRuntimeError(expr.name, "Only  instances have properties.")
+        shape = object.shape
+        if shape is not expr.cached_shape:
+            expr.cached_shape = shape
+            expr.cached_offset = shape.index.get(expr.name.lexeme)
+        if expr.cached_offset is not None:     # Fields shadow methods
+            return object.values[expr.cached_offset]
+        name = expr.name.lexeme
+        if object.klass is expr.cached_class:
+            return expr.cached_method.bind(object, name)
+        return self.find_method(expr, object.klass).bind(object, name)
+
+    # Inline cache miss at a property access. Methods can't change once a
+    # class exists, so each site remembers which method every receiver class
+    # resolved to: the latest class is checked inline by visitGetExpr, the
+    # others (up to POLYMORPHIC_LIMIT) are looked up here.
+    def find_method(self, expr, klass):
+        if expr.cache is None:
+            expr.cache = {}
+        method = expr.cache.get(klass)
+        if method is None:
+            method = klass.find_method(expr.name.lexeme)
+            if method is None:
+                raise LoxRuntimeError(expr.name, f"Undefined property {expr.name.lexeme}.")
+            if len(expr.cache) < POLYMORPHIC_LIMIT:
+                expr.cache[klass] = method
+        expr.cached_class = klass
+        expr.cached_method = method
+        return method
 
     def is_truthy(self, object):
         if object is None:
@@ -273,17 +443,18 @@ class Interpreter(Visitor):
         if isinstance(operand, float):
             return
         raise LoxRuntimeError(operator, "Operand must be a number")
-    
-    
-    def check_number_operands(self, operator, left, right):
-        if isinstance(left, float) and isinstance(right, float):
-            return
-        raise LoxRuntimeError(operator, "Operands must be a number")
+
+def stringify(ob):
+    if ob is None:
+        return "nil"
+    if isinstance(ob, float):
+        text = str(ob)
+        if text.endswith('.0'):
+            text = text[:-2]
+        return text
+    return str(ob)
 
 class LoxRuntimeError(RuntimeError):
     def __init__(self, token, message):
         super().__init__(message)
         self.token = token
-
-class BreakException(Exception):
-    pass
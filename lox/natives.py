@@ -0,0 +1,385 @@
+import functools
+import math
+import re
+import reprlib
+import time
+from callable import LoxCallable
+from vec import LoxVec
+import vec
+
+# Functions implemented in Python that every interpreter defines as globals.
+# Each takes the interpreter, then its Lox arguments; its arity is the number
+# of those. Lox numbers are floats, so natives return floats too.
+NATIVES = {}
+NUMBER = re.compile(r"\s*-?\d+(\.\d+)?\s*")
+# Numbers in a file read by readVec, which may have exponents, and what
+# separates them
+VEC_NUMBER = re.compile(r"[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?")
+VEC_SEPARATOR = re.compile(r"[\s,]+")
+
+class NativeFunction(LoxCallable):
+    __slots__ = ("name", "function", "argc")
+
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+        self.argc = function.__code__.co_argcount - 1
+
+    def call(self, interpreter, arguments):
+        return self.function(interpreter, *arguments)
+
+    def arity(self):
+        return self.argc
+
+    def __str__(self):
+        return "<native fn>"
+
+# Lox's list type. Lists are values like instances: == compares identity.
+class LoxList:
+    __slots__ = ("items",)
+
+    def __init__(self, items):
+        self.items = items
+
+    @reprlib.recursive_repr("[...]")
+    def __str__(self):
+        from interpreter import stringify
+        return "[" + ", ".join(map(stringify, self.items)) + "]"
+
+# Lox's map type, which keeps keys in insertion order. Keys are strings,
+# numbers, booleans and nil, and two keys are the same key exactly when
+# Interpreter.is_equal says they're equal: for these types that is Python's
+# == (so true and 1 are one key, as are 0 and -0), which a dict's hashing
+# agrees with, except for NaN, which equals nothing and isn't allowed.
+class LoxMap:
+    __slots__ = ("entries",)
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    @reprlib.recursive_repr("{...}")
+    def __str__(self):
+        from interpreter import stringify
+        return "{" + ", ".join(f"{stringify(key)}: {stringify(value)}" for key, value in self.entries.items()) + "}"
+
+def native(name):
+    def register(function):
+        NATIVES[name] = NativeFunction(name, function)
+        return function
+    return register
+
+# Natives don't know where they were called from, so their errors have no
+# token; the engine reports them at the failing call.
+def error(message):
+    from interpreter import LoxRuntimeError
+    return LoxRuntimeError(None, message)
+
+def check_number(name, value):
+    if type(value) is not float:
+        raise error(f"{name}() needs a number.")
+    return value
+
+def check_string(name, value):
+    if type(value) is not str:
+        raise error(f"{name}() needs a string.")
+    return value
+
+def check_list(name, value):
+    if type(value) is not LoxList:
+        raise error(f"{name}() needs a list.")
+    return value.items
+
+def check_index(name, value):
+    if type(value) is not float or not value.is_integer():
+        raise error(f"{name}() needs a whole number.")
+    return int(value)
+
+def check_map(name, value):
+    if type(value) is not LoxMap:
+        raise error(f"{name}() needs a map.")
+    return value.entries
+
+def check_key(name, key):
+    if key is not None and type(key) not in (str, float, bool):
+        raise error(f"{name}() needs a key that is a string, number, boolean or nil.")
+    if key != key:
+        raise error(f"{name}() can't use NaN as a key.")
+    return key
+
+def check_vec(name, value):
+    if type(value) is not LoxVec:
+        raise error(f"{name}() needs a vector.")
+    return value
+
+def check_count(name, value):
+    count = check_index(name, value)
+    if count < 0:
+        raise error(f"{name}() needs a whole number that isn't negative.")
+    return count
+
+# An index of an existing element of 'items', a list's or a vector's.
+def check_element(name, items, value, kind="list"):
+    index = check_index(name, value)
+    if not 0 <= index < len(items):
+        raise error(f"{name}() index {index} is out of range for a {kind} of {len(items)}.")
+    return index
+
+@native("clock")
+def clock(interpreter):
+    return time.perf_counter()
+
+@native("sqrt")
+def sqrt(interpreter, x):
+    if check_number("sqrt", x) < 0:
+        raise error("sqrt() needs a number that isn't negative.")
+    return math.sqrt(x)
+
+@native("floor")
+def floor(interpreter, x):
+    if not math.isfinite(check_number("floor", x)):
+        return x
+    return float(math.floor(x))
+
+@native("pow")
+def power(interpreter, x, y):
+    check_number("pow", x)
+    check_number("pow", y)
+    odd = y % 2 == 1
+    try:
+        return math.pow(x, y)
+    except OverflowError:
+        return -math.inf if x < 0 and odd else math.inf
+    except ValueError:
+        # Zero to a negative power, or a negative number to a fractional one
+        if x == 0:
+            return math.copysign(math.inf, x) if odd else math.inf
+        raise error("pow() of a negative number needs a whole exponent.") from None
+
+@native("len")
+def length(interpreter, value):
+    if type(value) is LoxList:
+        return float(len(value.items))
+    if type(value) is LoxVec:
+        return float(len(value.data))
+    return float(len(check_string("len", value)))
+
+# The part of 'string' that starts at index 'start' and is 'count' long, or
+# shorter where the string ends first.
+@native("substr")
+def substr(interpreter, string, start, count):
+    check_string("substr", string)
+    start = check_index("substr", start)
+    count = check_index("substr", count)
+    if start < 0 or count < 0:
+        raise error("substr() needs a start and length that aren't negative.")
+    return string[start:start + count]
+
+# Where 'part' first appears in a string, or the index of the first element
+# of a list equal to it; -1 if nowhere.
+@native("indexOf")
+def index_of(interpreter, value, part):
+    if type(value) is LoxList:
+        for index, item in enumerate(value.items):
+            if interpreter.is_equal(item, part):
+                return float(index)
+        return -1.0
+    return float(check_string("indexOf", value).find(check_string("indexOf", part)))
+
+@native("toString")
+def to_string(interpreter, value):
+    return interpreter.stringify(value)
+
+# nil unless 'string' is a Lox number literal, optionally negative.
+@native("parseNumber")
+def parse_number(interpreter, string):
+    if NUMBER.fullmatch(check_string("parseNumber", string)) is None:
+        return None
+    return float(string)
+
+@native("split")
+def split(interpreter, string, separator):
+    check_string("split", string)
+    if check_string("split", separator) == "":
+        return LoxList(list(string))
+    return LoxList(string.split(separator))
+
+@native("join")
+def join(interpreter, items, separator):
+    from interpreter import stringify
+    return check_string("join", separator).join(map(stringify, check_list("join", items)))
+
+@native("list")
+def new_list(interpreter):
+    return LoxList([])
+
+@native("append")
+def append(interpreter, items, value):
+    check_list("append", items).append(value)
+    return None
+
+# A list's or a vector's element at an index, or the value of a key in a
+# map, nil if it has none.
+@native("get")
+def get(interpreter, container, key):
+    if type(container) is LoxMap:
+        return container.entries.get(check_key("get", key))
+    if type(container) is LoxVec:
+        data = container.data
+        return float(data[check_element("get", data, key, "vector")])
+    if type(container) is not LoxList:
+        raise error("get() needs a list, a vector or a map.")
+    items = container.items
+    return items[check_element("get", items, key)]
+
+@native("set")
+def set_item(interpreter, container, key, value):
+    if type(container) is LoxMap:
+        container.entries[check_key("set", key)] = value
+        return value
+    if type(container) is not LoxList:
+        raise error("set() needs a list or a map.")
+    items = container.items
+    items[check_element("set", items, key)] = value
+    return value
+
+@native("pop")
+def pop(interpreter, items):
+    items = check_list("pop", items)
+    if not items:
+        raise error("pop() needs a list that isn't empty.")
+    return items.pop()
+
+# A new list of the elements from 'start' up to, but not including, 'end',
+# or to the end of the list if it's shorter. A vector's slice is a view that
+# shares its buffer instead of a copy.
+@native("slice")
+def slice_list(interpreter, items, start, end):
+    start = check_index("slice", start)
+    end = check_index("slice", end)
+    if start < 0 or end < start:
+        raise error("slice() needs 0 <= start <= end.")
+    if type(items) is LoxVec:
+        return vec.view(items, start, end)
+    return LoxList(check_list("slice", items)[start:end])
+
+# Sorts in place, by 'comparator(a, b)', which returns a number below, equal
+# to or above zero as a sorts before, with or after b. Without one, the list
+# must hold only numbers or only strings. The sort is stable.
+@native("sort")
+def sort(interpreter, items, comparator):
+    items = check_list("sort", items)
+    if comparator is None:
+        kinds = set(map(type, items))
+        if len(kinds) > 1 or not kinds <= {float, str}:
+            raise error("sort() without a comparator needs a list of only numbers or only strings.")
+        items.sort()
+        return None
+    def compare(a, b):
+        order = interpreter.apply(comparator, [a, b])
+        if type(order) is not float:
+            raise error("sort() comparator must return a number.")
+        return order
+    try:
+        items.sort(key=functools.cmp_to_key(compare))
+    except ValueError:
+        raise error("sort() comparator changed the list.") from None
+    return None
+
+# Calls 'function' with each element the list had when forEach began.
+@native("forEach")
+def for_each(interpreter, items, function):
+    for item in check_list("forEach", items)[:]:
+        interpreter.apply(function, [item])
+    return None
+
+@native("map")
+def new_map(interpreter):
+    return LoxMap({})
+
+@native("has")
+def has(interpreter, entries, key):
+    return check_key("has", key) in check_map("has", entries)
+
+# Removes a key from a map; returns whether it was there.
+@native("delete")
+def delete(interpreter, entries, key):
+    entries = check_map("delete", entries)
+    key = check_key("delete", key)
+    if key not in entries:
+        return False
+    del entries[key]
+    return True
+
+# A list of a map's keys, in the order they were first set.
+@native("keys")
+def keys(interpreter, entries):
+    return LoxList(list(check_map("keys", entries)))
+
+@native("size")
+def size(interpreter, entries):
+    return float(len(check_map("size", entries)))
+
+@native("vec")
+def new_vec(interpreter, items):
+    items = check_list("vec", items)
+    if not all(type(item) is float for item in items):
+        raise error("vec() needs a list of only numbers.")
+    return vec.make(items)
+
+@native("zeros")
+def zeros(interpreter, count):
+    return vec.zeros(check_count("zeros", count))
+
+# The vector 0, 1, ... count - 1.
+@native("range")
+def arange(interpreter, count):
+    return vec.arange(check_count("range", count))
+
+# A vector of the numbers in a file, separated by whitespace or commas.
+@native("readVec")
+def read_vec(interpreter, path):
+    try:
+        with open(check_string("readVec", path)) as f:
+            text = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        raise error(f"readVec() can't read '{path}': {getattr(e, 'strerror', None) or e}.") from None
+    fields = VEC_SEPARATOR.split(text.strip(" \t\r\n,"))
+    if fields == [""]:
+        fields = []
+    for field in fields:
+        if VEC_NUMBER.fullmatch(field) is None:
+            raise error(f"readVec() found '{field}' in '{path}', which isn't a number.")
+    return vec.make(map(float, fields))
+
+@native("toList")
+def to_list(interpreter, value):
+    return LoxList(vec.elements(check_vec("toList", value)))
+
+@native("sum")
+def total(interpreter, value):
+    return vec.total(check_vec("sum", value))
+
+@native("min")
+def minimum(interpreter, value):
+    if not len(check_vec("min", value).data):
+        raise error("min() needs a vector that isn't empty.")
+    return vec.smallest(value)
+
+@native("max")
+def maximum(interpreter, value):
+    if not len(check_vec("max", value).data):
+        raise error("max() needs a vector that isn't empty.")
+    return vec.largest(value)
+
+@native("mean")
+def mean(interpreter, value):
+    count = len(check_vec("mean", value).data)
+    if not count:
+        raise error("mean() needs a vector that isn't empty.")
+    return vec.total(value) / count
+
+@native("dot")
+def dot(interpreter, a, b):
+    if len(check_vec("dot", a).data) != len(check_vec("dot", b).data):
+        raise error(f"dot() needs vectors of the same length, not {len(a.data)} and {len(b.data)}.")
+    return vec.dot(a, b)
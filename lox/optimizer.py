@@ -0,0 +1,882 @@
+import copy
+import operator
+import _token
+from expr import *
+from stmt import *
+
+# Operators folded when both operands are numbers. Division by zero is left
+# for run time so that it fails the same way it does unoptimized.
+NUMERIC = {_token.MINUS: operator.sub, _token.SLASH: operator.truediv, _token.STAR: operator.mul,
+           _token.GREATER: operator.gt, _token.GREATER_EQUAL: operator.ge,
+           _token.LESS: operator.lt, _token.LESS_EQUAL: operator.le}
+
+class Optimizer(Visitor):
+    # Rewrites a resolved program in place: constant Binary, Unary, Logical
+    # and Grouping subtrees become Literals, Groupings disappear, constant
+    # If and While conditions pick their branch, and statements that can't
+    # run (after a return or break, or with no effect) are dropped. Nothing
+    # that could raise a runtime error is folded, and no scope is removed,
+    # so the Resolver's depths and slots still hold.
+    def __init__(self, interpreter, inline_budget=0):
+        self.interpreter = interpreter
+        self.inline_budget = inline_budget
+
+    def optimize(self, statements):
+        statements = self.statements(statements)
+        inliner = Inliner(self.inline_budget)
+        statements = inliner.inline(statements)
+        if inliner.inlined:
+            statements = self.statements(statements)    # Fold what the arguments made constant
+        return LoopOptimizer().optimize(statements)
+
+    def statements(self, statements):
+        optimized = []
+        for statement in statements:
+            statement = self.statement(statement)
+            if statement is None:
+                continue
+            optimized.append(statement)
+            if isinstance(statement, (Return, Break)):
+                break       # The rest of the block is unreachable
+        return optimized
+
+    def statement(self, stmt):
+        return stmt.accept(self)
+
+    def branch(self, stmt):
+        # A statement that can't be dropped because its parent needs one
+        stmt = self.statement(stmt)
+        if stmt is None:
+            return Block([])
+        return stmt
+
+    def expression(self, expr):
+        return expr.accept(self)
+
+    def function(self, function):
+        function.body = self.statements(function.body)
+
+    def visitBlockStmt(self, stmt):
+        stmt.statements = self.statements(stmt.statements)
+        if not stmt.statements:
+            return None
+        return stmt
+
+    def visitClassStmt(self, stmt):
+        for method in stmt.methods:
+            self.function(method.function)
+        return stmt
+
+    def visitExpressionStmt(self, stmt):
+        stmt.expression = self.expression(stmt.expression)
+        if isinstance(stmt.expression, Literal):
+            return None
+        return stmt
+
+    def visitFunctionStmt(self, stmt):
+        self.function(stmt.function)
+        return stmt
+
+    def visitIfStmt(self, stmt):
+        stmt.condition = self.expression(stmt.condition)
+        if isinstance(stmt.condition, Literal):
+            if self.interpreter.is_truthy(stmt.condition.value):
+                return self.statement(stmt.then_branch)
+            if stmt.else_branch is None:
+                return None
+            return self.statement(stmt.else_branch)
+        stmt.then_branch = self.branch(stmt.then_branch)
+        if stmt.else_branch is not None:
+            stmt.else_branch = self.statement(stmt.else_branch)
+        return stmt
+
+    def visitPrintStmt(self, stmt):
+        stmt.expression = self.expression(stmt.expression)
+        return stmt
+
+    def visitReturnStmt(self, stmt):
+        if stmt.value is not None:
+            stmt.value = self.expression(stmt.value)
+            stmt.tail = stmt.tail and isinstance(stmt.value, Call)     # Inlining may have replaced the call
+        return stmt
+
+    def visitBreakStmt(self, stmt):
+        return stmt
+
+    def visitVarStmt(self, stmt):
+        if stmt.initializer is not None:
+            stmt.initializer = self.expression(stmt.initializer)
+        return stmt
+
+    def visitWhileStmt(self, stmt):
+        stmt.condition = self.expression(stmt.condition)
+        if isinstance(stmt.condition, Literal) and not self.interpreter.is_truthy(stmt.condition.value):
+            return None
+        stmt.body = self.branch(stmt.body)
+        return stmt
+
+    def visitAssignExpr(self, expr):
+        expr.value = self.expression(expr.value)
+        return expr
+
+    def visitBinaryExpr(self, expr):
+        expr.left = self.expression(expr.left)
+        expr.right = self.expression(expr.right)
+        if not isinstance(expr.left, Literal) or not isinstance(expr.right, Literal):
+            return expr
+        left = expr.left.value
+        right = expr.right.value
+        type = expr.operator.type
+        if type in NUMERIC:
+            if isinstance(left, float) and isinstance(right, float) and \
+                    not (type == _token.SLASH and right == 0):
+                return Literal(NUMERIC[type](left, right))
+        elif type == _token.PLUS:
+            if (isinstance(left, float) and isinstance(right, float)) or \
+                    (isinstance(left, str) and isinstance(right, str)):
+                return Literal(left + right)
+        elif type == _token.EQUAL_EQUAL:
+            return Literal(self.interpreter.is_equal(left, right))
+        elif type == _token.BANG_EQUAL:
+            return Literal(not self.interpreter.is_equal(left, right))
+        return expr
+
+    def visitCallExpr(self, expr):
+        expr.callee = self.expression(expr.callee)
+        expr.arguments = [self.expression(argument) for argument in expr.arguments]
+        return expr
+
+    def visitGetExpr(self, expr):
+        expr.object = self.expression(expr.object)
+        return expr
+
+    def visitSetExpr(self, expr):
+        expr.object = self.expression(expr.object)
+        expr.value = self.expression(expr.value)
+        return expr
+
+    def visitSuperExpr(self, expr):
+        return expr
+
+    def visitThisExpr(self, expr):
+        return expr
+
+    def visitGroupingExpr(self, expr):
+        return self.expression(expr.expression)
+
+    def visitLiteralExpr(self, expr):
+        return expr
+
+    def visitLogicalExpr(self, expr):
+        expr.left = self.expression(expr.left)
+        expr.right = self.expression(expr.right)
+        if not isinstance(expr.left, Literal):
+            return expr
+        truthy = self.interpreter.is_truthy(expr.left.value)
+        if expr.operator.type == _token.OR:
+            return expr.left if truthy else expr.right
+        return expr.right if truthy else expr.left
+
+    def visitUnaryExpr(self, expr):
+        expr.right = self.expression(expr.right)
+        if not isinstance(expr.right, Literal):
+            return expr
+        value = expr.right.value
+        if expr.operator.type == _token.MINUS:
+            if isinstance(value, float):
+                return Literal(-value)
+            return expr
+        return Literal(not self.interpreter.is_truthy(value))
+
+    def visitVariableExpr(self, expr):
+        return expr
+
+    def visitFunctionExpressionExpr(self, expr):
+        self.function(expr)
+        return expr
+
+# Expressions with no side effects, and those among them worth caching
+PURE = (Binary, Unary, Logical, Grouping)
+CACHED = (Binary, Unary, Logical)
+# Binary operators whose result is a boolean whatever the operands
+EQUALITY = (_token.EQUAL_EQUAL, _token.BANG_EQUAL)
+
+# The fields of each node class that hold other nodes or lists of them
+FIELDS = {Assign: ("value",), Binary: ("left", "right"), Call: ("callee", "arguments"),
+          Get: ("object",), Set: ("object", "value"), Super: (), This: (),
+          Grouping: ("expression",), Literal: (), Logical: ("left", "right"), Unary: ("right",),
+          Variable: (), FunctionExpression: ("body",),
+          Block: ("statements",), Class: ("superclass", "methods"), Break: (),
+          Expression: ("expression",), Function: ("function",),
+          If: ("condition", "then_branch", "else_branch"), Print: ("expression",),
+          Return: ("value",), Var: ("initializer",), While: ("condition", "body")}
+
+def children(node):
+    # The fields of a node that hold other nodes, as (name, node or list)
+    for field in FIELDS[node.__class__]:
+        value = getattr(node, field)
+        if value is not None:
+            yield field, value
+
+def child_nodes(node):
+    for field in FIELDS[node.__class__]:
+        value = getattr(node, field)
+        if value.__class__ is list:
+            yield from value
+        elif value is not None:
+            yield value
+
+def contains(node, kind):
+    return isinstance(node, kind) or any(contains(child, kind) for child in child_nodes(node))
+
+class Rewriter:
+    # A pass that may replace any node: rewrite returns the replacement,
+    # which is stored back into the parent's field.
+    def rewrite_children(self, node):
+        for field, value in children(node):
+            if isinstance(value, list):
+                self.rewrite_all(node, field)
+            else:
+                setattr(node, field, self.rewrite(value))
+
+    def rewrite_all(self, node, field):
+        setattr(node, field, [self.rewrite(child) for child in getattr(node, field)])
+
+class LoopAnalyzer:
+    # Finds, for every local reference, the declaration it resolves to as
+    # (node that opened the scope, slot), which declarations a nested function
+    # uses or assigns, what is stored in each declared variable, and for
+    # every loop the scopes opened inside it, the locals and globals it
+    # assigns and whether it calls anything.
+    def __init__(self):
+        self.scopes = []
+        self.slots = []         # Next free slot of each scope
+        self.stores = {}        # Declaration -> values stored in it, None for unknown ones
+        self.functions = 0
+        self.loops = []
+        self.declarations = {}
+        self.captured = set()
+        self.assigned_by_closure = set()
+        self.inside = {}
+        self.assigned = {}
+        self.globals = {}
+        self.calls = set()
+
+    def analyze(self, statements):
+        for statement in statements:
+            self.walk(statement)
+        return self
+
+    def walk(self, node):
+        if isinstance(node, Block):
+            self.scoped(node, node.statements)
+        elif isinstance(node, FunctionExpression):
+            self.function(node, 0)
+        elif isinstance(node, Function):
+            self.declare(None)
+            self.function(node.function, 0)
+        elif isinstance(node, Class):
+            self.declare(None)
+            self.walk(node.superclass)
+            if node.superclass is None:
+                self.methods(node)
+            else:
+                self.begin_scope(node, 1)       # 'super'
+                self.methods(node)
+                self.end_scope()
+        elif isinstance(node, Var):
+            self.walk(node.initializer)
+            self.declare(Literal(None) if node.initializer is None else node.initializer)
+        elif isinstance(node, While):
+            self.loops.append(node)
+            self.inside[node] = set()
+            self.assigned[node] = set()
+            self.globals[node] = set()
+            self.walk_all(child_nodes(node))
+            self.loops.pop()
+        elif isinstance(node, Assign):
+            self.walk(node.value)
+            declaration = self.reference(node)
+            if declaration is not None:
+                if self.scopes[-1 - node.depth][1] < self.functions:
+                    self.assigned_by_closure.add(declaration)
+                self.store(declaration, node.value)
+            for loop in self.loops:
+                if declaration is None:
+                    self.globals[loop].add(node.name.lexeme)
+                else:
+                    self.assigned[loop].add(declaration)
+        elif isinstance(node, (Variable, This, Super)):
+            self.reference(node)
+        elif node is not None:
+            if isinstance(node, Call):
+                self.calls.update(self.loops)
+            self.walk_all(child_nodes(node))
+
+    def walk_all(self, nodes):
+        for node in nodes:
+            self.walk(node)
+
+    def scoped(self, node, statements, slots=0):
+        self.begin_scope(node, slots)
+        self.walk_all(statements)
+        self.end_scope()
+
+    def begin_scope(self, node, slots):
+        self.scopes.append((node, self.functions))
+        self.slots.append(slots)
+        for loop in self.loops:
+            self.inside[loop].add(node)
+
+    def end_scope(self):
+        self.scopes.pop()
+        self.slots.pop()
+
+    # Parameters, and the receiver of methods, take the first slots
+    def function(self, function, receiver):
+        self.functions += 1
+        self.scoped(function, function.body, receiver + len(function.params))
+        self.functions -= 1
+
+    def methods(self, klass):
+        for method in klass.methods:
+            self.function(method.function, 1)
+
+    # A Var, Function or Class statement takes the next slot of its scope;
+    # 'value' is what the variable starts out holding, if that is known
+    def declare(self, value):
+        if not self.scopes:
+            return      # A global
+        declaration = (self.scopes[-1][0], self.slots[-1])
+        self.slots[-1] += 1
+        self.stores[declaration] = None if value is None else [value]
+
+    def store(self, declaration, value):
+        values = self.stores.get(declaration)
+        if values is not None:
+            values.append(value)
+
+    # The declarations that only ever hold numbers, strings, booleans or nil:
+    # values that == compares by value, so that one can't be told from an
+    # equal one computed again.
+    def scalars(self):
+        scalars = {declaration for declaration, values in self.stores.items() if values is not None}
+        changed = True
+        while changed:
+            changed = False
+            for declaration in list(scalars):
+                if not all(self.scalar(value, scalars) for value in self.stores[declaration]):
+                    scalars.discard(declaration)
+                    changed = True
+        return scalars
+
+    def scalar(self, expr, scalars):
+        if isinstance(expr, Literal):
+            return True
+        if isinstance(expr, Variable):
+            return self.declarations.get(expr) in scalars
+        if isinstance(expr, Grouping):
+            return self.scalar(expr.expression, scalars)
+        if isinstance(expr, Unary):
+            return True     # Negation only works on numbers, ! makes a boolean
+        if isinstance(expr, Binary) and expr.operator.type in EQUALITY:
+            return True
+        if isinstance(expr, (Binary, Logical)):
+            return self.scalar(expr.left, scalars) and self.scalar(expr.right, scalars)
+        return False
+
+    def reference(self, expr):
+        if expr.depth is None:
+            return None
+        scope, function = self.scopes[-1 - expr.depth]
+        declaration = (scope, expr.slot)
+        self.declarations[expr] = declaration
+        if function < self.functions:
+            self.captured.add(declaration)
+        return declaration
+
+class Region:
+    # The outermost loop of a function body together with everything it
+    # moved into the scope wrapped around it.
+    def __init__(self):
+        self.index = None       # Runtime scope of the wrapper, if there is one
+        self.names = []         # Tokens of the wrapper's variables, by slot
+        self.blocks = set()     # Blocks whose variables live in the wrapper
+        self.hoisted = {}       # Var in one of those blocks -> (slot, name)
+        self.invariants = {}    # Loop-invariant expression -> its loop
+        self.resets = {}        # Inner loop -> invariant slots to clear on entry
+
+class LoopOptimizer(Rewriter):
+    # Takes work out of loop bodies. Blocks inside a loop whose variables no
+    # closure captures stop allocating an environment every time they run:
+    # their variables move into a single scope wrapped around the outermost
+    # loop, and each declaration becomes an assignment. Pure expressions whose
+    # operands the loop can't change (locals it doesn't assign and no closure
+    # assigns, globals it neither assigns nor could assign through a call) are
+    # cached in that scope too, as `cache or (cache = expression)`. The cache
+    # is filled the first time the expression runs, so it still raises where
+    # it did, and a false or nil result is simply recomputed. A cached result
+    # is the same object every time, so only expressions known to make a
+    # number, string, boolean or nil are cached: arithmetic on a vector makes
+    # a new one each time it runs, and == would tell a cached one apart. What
+    # globals hold is never known, since a statement optimized later (in the
+    # REPL or with --stream) may store anything in them.
+    # Depths and slots are rewritten to match the scopes that remain.
+    def optimize(self, statements):
+        self.scopes = []        # Per resolved scope: (runtime scope, slot offset, names)
+        self.depth = 0          # Runtime scopes open
+        self.region = None
+        self.loops = []
+        optimized = []
+        for statement in statements:
+            # Everything the analysis finds about locals stays within one
+            # top-level statement, and statements without loops don't change
+            if contains(statement, While):
+                self.analysis = LoopAnalyzer().analyze([statement])
+                self.scalars = self.analysis.scalars()
+                statement = self.rewrite(statement)
+            optimized.append(statement)
+        return optimized
+
+    def rewrite(self, node):
+        if isinstance(node, Block):
+            return self.block(node)
+        if isinstance(node, FunctionExpression):
+            region, loops = self.region, self.loops
+            self.region, self.loops = None, []
+            self.scoped(node, "body")
+            self.region, self.loops = region, loops
+            return node
+        if isinstance(node, Class):
+            node.superclass = self.rewrite(node.superclass)
+            if node.superclass is None:
+                self.rewrite_all(node, "methods")
+            else:
+                self.scoped(node, "methods")
+            return node
+        if isinstance(node, While):
+            return self.loop(node)
+        if isinstance(node, Var) and self.region is not None and node in self.region.hoisted:
+            return self.declaration(node)
+        if isinstance(node, (Variable, Assign, This, Super)):
+            if isinstance(node, Assign):
+                node.value = self.rewrite(node.value)
+            self.remap(node)
+            return node
+        if node is None:
+            return None
+        self.rewrite_children(node)
+        if self.region is not None and node in self.region.invariants:
+            return self.cache(node)
+        return node
+
+    def scoped(self, node, field):
+        self.scopes.append((self.depth, 0, None))
+        self.depth += 1
+        self.rewrite_all(node, field)
+        self.depth -= 1
+        self.scopes.pop()
+
+    def block(self, stmt):
+        if self.region is None or stmt not in self.region.blocks:
+            self.scoped(stmt, "statements")
+            return stmt
+        offset = len(self.region.names)
+        names = []
+        for statement in stmt.statements:
+            if isinstance(statement, Var):
+                slot, name = self.allocate(statement.name)
+                self.region.hoisted[statement] = (slot, name)
+                names.append(name)
+        self.scopes.append((self.region.index, offset, names))
+        self.rewrite_all(stmt, "statements")
+        self.scopes.pop()
+        stmt.unscoped = True
+        return stmt
+
+    def declaration(self, stmt):
+        slot, name = self.region.hoisted[stmt]
+        value = Literal(None) if stmt.initializer is None else self.rewrite(stmt.initializer)
+        return Expression(self.local(Assign(name, value), slot))
+
+    def loop(self, stmt):
+        if self.region is not None:
+            self.loops.append(stmt)
+            self.rewrite_loop(stmt)
+            self.loops.pop()
+            resets = self.region.resets.get(stmt)
+            if not resets:
+                return stmt
+            block = Block([Expression(self.local(Assign(self.region.names[slot], Literal(None)), slot))
+                           for slot in resets] + [stmt])
+            block.unscoped = True
+            return block
+
+        self.region = self.scan(stmt)
+        wrapped = self.region.index is not None
+        if wrapped:
+            self.depth += 1
+        self.loops.append(stmt)
+        self.rewrite_loop(stmt)
+        self.loops.pop()
+        if wrapped:
+            self.depth -= 1
+            stmt = Block([Var(name, None) for name in self.region.names] + [stmt])
+        self.region = None
+        return stmt
+
+    def rewrite_loop(self, stmt):
+        stmt.condition = self.rewrite(stmt.condition)
+        stmt.body = self.rewrite(stmt.body)
+
+    def remap(self, expr):
+        if expr.depth is None:
+            return
+        index, offset, names = self.scopes[-1 - expr.depth]
+        if names is not None:
+            # The wrapper variable's name, at this use's line, which the
+            # Python engine reports errors at
+            expr.name = _token.Token(_token.IDENTIFIER, names[expr.slot].lexeme, None, expr.name.line)
+        expr.depth = self.depth - 1 - index
+        expr.slot += offset
+
+    def local(self, expr, slot):
+        expr.depth = self.depth - 1 - self.region.index
+        expr.slot = slot
+        return expr
+
+    def allocate(self, name):
+        # Wrapper variables need distinct names for the Python engine
+        slot = len(self.region.names)
+        lexeme = name.lexeme
+        taken = {other.lexeme for other in self.region.names}
+        while lexeme in taken:
+            lexeme = f"{lexeme}_{slot}"
+        name = _token.Token(_token.IDENTIFIER, lexeme, None, name.line)
+        self.region.names.append(name)
+        return slot, name
+
+    def cache(self, expr):
+        loop = self.region.invariants[expr]
+        line = expr.operator.line
+        slot, name = self.allocate(_token.Token(_token.IDENTIFIER, "invariant", None, line))
+        if loop is not self.loops[0]:
+            self.region.resets.setdefault(loop, []).append(slot)
+        return Logical(self.local(Variable(name), slot),
+                       _token.Token(_token.OR, "or", None, line),
+                       self.local(Assign(name, expr), slot))
+
+    def scan(self, stmt):
+        # Decides what the region starting at this loop will move out
+        region = Region()
+        self.region = region
+        self.scan_node(stmt, [])
+        if region.invariants or any(self.declares(block) for block in region.blocks):
+            region.index = self.depth
+        return region
+
+    def declares(self, block):
+        return any(isinstance(statement, Var) for statement in block.statements)
+
+    def scan_node(self, node, loops):
+        # Returns the index of the outermost enclosing loop the node is
+        # invariant in, or len(loops) if it isn't invariant in any
+        if isinstance(node, Literal):
+            return 0
+        if isinstance(node, (Variable, This)):
+            return self.invariance(node, loops)
+        if isinstance(node, FunctionExpression) or node is None:
+            return len(loops)
+        if isinstance(node, Block) and self.hoistable(node):
+            self.region.blocks.add(node)
+        if isinstance(node, Class):
+            self.scan_node(node.superclass, loops)
+            return len(loops)
+        if isinstance(node, While):
+            loops = loops + [node]
+        levels = [(child, self.scan_node(child, loops)) for child in child_nodes(node)]
+        if isinstance(node, PURE) and self.analysis.scalar(node, self.scalars):
+            level = max((level for _, level in levels), default=0)
+        else:
+            level = len(loops)
+        for child, child_level in levels:
+            if isinstance(child, CACHED) and child_level < len(loops) and child_level != level:
+                self.region.invariants[child] = loops[child_level]
+        return level
+
+    def invariance(self, expr, loops):
+        analysis = self.analysis
+        if expr.depth is None:
+            for i, loop in enumerate(loops):
+                if loop not in analysis.calls and expr.name.lexeme not in analysis.globals[loop]:
+                    return i
+            return len(loops)
+        declaration = analysis.declarations[expr]
+        if declaration in analysis.assigned_by_closure:
+            return len(loops)
+        for i, loop in enumerate(loops):
+            if declaration[0] not in analysis.inside[loop] and declaration not in analysis.assigned[loop]:
+                return i
+        return len(loops)
+
+    def hoistable(self, block):
+        slot = 0
+        for statement in block.statements:
+            if isinstance(statement, (Function, Class)):
+                return False
+            if isinstance(statement, Var):
+                if (block, slot) in self.analysis.captured:
+                    return False
+                slot += 1
+        return True
+
+def size(node):
+    return 1 + sum(size(child) for child in child_nodes(node))
+
+def sequence(first, then):
+    # Evaluates the assignment first, then returns then: (first and false) or then
+    line = first.name.line
+    return Logical(Logical(first, _token.Token(_token.AND, "and", None, line), Literal(False)),
+                   _token.Token(_token.OR, "or", None, line), then)
+
+class Inliner(Rewriter):
+    # Replaces calls to small top-level functions with the expression they
+    # return. A function qualifies when its body is a single return, it makes
+    # no closures, it isn't recursive, its name is only ever called (never
+    # assigned, redeclared or passed around) and its return value has at most
+    # `budget` nodes. Only calls made after the declaration are inlined, so
+    # calling a function too early still fails the same way.
+    #
+    # Arguments that are literals, 'this' or locals nothing else can change
+    # are substituted for their parameter. The rest are evaluated in order
+    # into temporaries declared at the start of the enclosing block or
+    # function, which moves the slots of that scope's other variables up.
+    def __init__(self, budget):
+        self.budget = budget
+        self.inlined = 0
+
+    def inline(self, statements):
+        if self.budget <= 0:
+            return statements
+        self.candidates = self.find_candidates(statements)
+        if not self.candidates:
+            return statements
+        self.analysis = LoopAnalyzer().analyze(statements)
+        self.declared = set()
+        for statement in statements:
+            name = statement.name.lexeme if isinstance(statement, Function) else None
+            self.caller = name if name in self.candidates else None
+            self.temps = {}
+            self.count(statement, [])
+            self.scopes = []
+            self.rewrite(statement)
+            if self.caller is not None:
+                if size(statement.function.body[0].value) > self.budget:
+                    del self.candidates[name]     # Grew too big from what was inlined into it
+                else:
+                    self.declared.add(name)
+        return statements
+
+    def find_candidates(self, statements):
+        if not any(isinstance(statement, Function) and len(statement.function.body) == 1
+                   for statement in statements):
+            return {}
+        declarations = {}
+        for statement in statements:
+            if isinstance(statement, (Var, Function, Class)):
+                name = statement.name.lexeme
+                declarations[name] = declarations.get(name, 0) + 1
+        excluded = set()
+        callees = set()
+        def visit(node):
+            if isinstance(node, Call) and isinstance(node.callee, Variable):
+                callees.add(node.callee)
+            elif isinstance(node, (Variable, Assign)) and node.depth is None and node not in callees:
+                excluded.add(node.name.lexeme)
+            for child in child_nodes(node):
+                visit(child)
+        for statement in statements:
+            visit(statement)
+
+        candidates = {}
+        for statement in statements:
+            if not isinstance(statement, Function):
+                continue
+            name = statement.name.lexeme
+            body = statement.function.body
+            if declarations[name] > 1 or name in excluded or len(body) != 1 or \
+                    not isinstance(body[0], Return) or body[0].value is None:
+                continue
+            if size(body[0].value) <= self.budget and not self.makes_closures(body[0].value):
+                candidates[name] = statement.function
+
+        calls = {name: self.calls(function.body[0].value) & candidates.keys()
+                 for name, function in candidates.items()}
+        for name in list(candidates):
+            if self.reaches(name, name, calls, set()):
+                del candidates[name]
+        return candidates
+
+    def makes_closures(self, node):
+        return isinstance(node, FunctionExpression) or \
+            any(self.makes_closures(child) for child in child_nodes(node))
+
+    def calls(self, node):
+        names = set()
+        if isinstance(node, Call) and isinstance(node.callee, Variable) and node.callee.depth is None:
+            names.add(node.callee.name.lexeme)
+        for child in child_nodes(node):
+            names |= self.calls(child)
+        return names
+
+    def reaches(self, start, target, calls, seen):
+        for name in calls[start]:
+            if name == target:
+                return True
+            if name not in seen:
+                seen.add(name)
+                if self.reaches(name, target, calls, seen):
+                    return True
+        return False
+
+    def plan(self, call):
+        # The temporaries inlining this call needs, or None if it can't be
+        callee = call.callee
+        if not isinstance(callee, Variable) or callee.depth is not None:
+            return None
+        name = callee.name.lexeme
+        if name not in self.declared:
+            return None
+        function = self.candidates[name]
+        if len(call.arguments) != len(function.params):
+            return None
+        assigned = self.assigned_params(function.body[0].value)
+        return [slot in assigned or not self.is_stable(argument, call)
+                for slot, argument in enumerate(call.arguments)]
+
+    def placed(self, plan, scopes):
+        # Temporaries need a block or function to live in, and a function
+        # that is itself inlined can't declare any
+        return plan is not None and (not any(plan) or (scopes and self.caller is None))
+
+    def assigned_params(self, node):
+        slots = set()
+        if isinstance(node, Assign) and node.depth == 0:
+            slots.add(node.slot)
+        for child in child_nodes(node):
+            slots |= self.assigned_params(child)
+        return slots
+
+    def is_stable(self, argument, call):
+        # Whether the argument still has its value when the body reads it
+        if isinstance(argument, (Literal, This)):
+            return True
+        if not isinstance(argument, Variable) or argument.depth is None:
+            return False
+        declaration = self.analysis.declarations[argument]
+        if declaration in self.analysis.assigned_by_closure:
+            return False
+        return not any(self.assigns(other, declaration) for other in call.arguments)
+
+    def assigns(self, node, declaration):
+        if isinstance(node, Assign) and self.analysis.declarations.get(node) == declaration:
+            return True
+        return any(self.assigns(child, declaration) for child in child_nodes(node))
+
+    def count(self, node, scopes):
+        if isinstance(node, (Block, FunctionExpression)):
+            scopes = scopes + [node]
+        elif isinstance(node, Call):
+            plan = self.plan(node)
+            if self.placed(plan, scopes) and any(plan):
+                self.temps[scopes[-1]] = self.temps.get(scopes[-1], 0) + sum(plan)
+        for child in child_nodes(node):
+            self.count(child, scopes)
+
+    def rewrite(self, node):
+        if isinstance(node, Block):
+            self.scoped(node, "statements", 0)
+            return node
+        if isinstance(node, FunctionExpression):
+            self.scoped(node, "body", len(node.params))
+            return node
+        if isinstance(node, Class):
+            node.superclass = self.rewrite(node.superclass)
+            if node.superclass is not None:
+                self.scopes.append((0, 0, [], None))
+            for method in node.methods:
+                self.scoped(method.function, "body", len(method.function.params) + 1)
+            if node.superclass is not None:
+                self.scopes.pop()
+            return node
+        if isinstance(node, (Variable, Assign, This, Super)):
+            if isinstance(node, Assign):
+                node.value = self.rewrite(node.value)
+            if node.depth is not None:
+                base, shift, _, _ = self.scopes[-1 - node.depth]
+                if node.slot >= base:
+                    node.slot += shift
+            return node
+        if node is None:
+            return None
+        plan = self.plan(node) if isinstance(node, Call) else None
+        self.rewrite_children(node)
+        if self.placed(plan, self.scopes):
+            return self.expand(node, plan)
+        return node
+
+    def scoped(self, node, field, base):
+        temps = []
+        statements = getattr(node, field)
+        # Temporaries need names of their own for the Python engine
+        names = {statement.name.lexeme for statement in statements if isinstance(statement, (Var, Function, Class))}
+        if isinstance(node, FunctionExpression):
+            names.update(param.lexeme for param in node.params)
+        self.scopes.append((base, self.temps.get(node, 0), temps, names))
+        self.rewrite_all(node, field)
+        self.scopes.pop()
+        if temps:
+            setattr(node, field, [Var(name, None) for name in temps] + getattr(node, field))
+
+    def expand(self, call, plan):
+        function = self.candidates[call.callee.name.lexeme]
+        arguments = []
+        assignments = []
+        for argument, temporary, param in zip(call.arguments, plan, function.params):
+            if not temporary:
+                arguments.append(argument)
+                continue
+            base, _, temps, names = self.scopes[-1]
+            slot = base + len(temps)
+            lexeme = f"{param.lexeme}_{slot}"
+            while lexeme in names:
+                lexeme += "_"
+            names.add(lexeme)
+            name = _token.Token(_token.IDENTIFIER, lexeme, None, param.line)
+            temps.append(name)
+            arguments.append(self.local(Variable(name), slot))
+            assignments.append(self.local(Assign(name, argument), slot))
+        value = self.substitute(copy.deepcopy(function.body[0].value), arguments)
+        for assignment in reversed(assignments):
+            value = sequence(assignment, value)
+        self.inlined += 1
+        return value
+
+    def local(self, expr, slot):
+        expr.depth = 0
+        expr.slot = slot
+        return expr
+
+    def substitute(self, node, arguments):
+        if isinstance(node, Variable) and node.depth == 0:
+            return copy.deepcopy(arguments[node.slot])
+        if isinstance(node, Assign) and node.depth == 0:
+            temporary = arguments[node.slot]
+            node.name = temporary.name
+            node.slot = temporary.slot
+        for field, value in children(node):
+            if isinstance(value, list):
+                setattr(node, field, [self.substitute(child, arguments) for child in value])
+            else:
+                setattr(node, field, self.substitute(value, arguments))
+        return node
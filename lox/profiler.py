@@ -0,0 +1,94 @@
+import json
+import time
+from callable import LoxInstance
+from tracing import Hook, first_line, function_name
+
+TOP_LINES = 20
+
+class FunctionStats:
+    __slots__ = ("name", "line", "calls", "inclusive", "self_time", "instances", "environments", "active")
+
+    def __init__(self, name, line):
+        self.name = name
+        self.line = line
+        self.calls = 0
+        self.inclusive = 0.0
+        self.self_time = 0.0
+        self.instances = 0
+        self.environments = 0
+        self.active = 0         # Calls of it on the stack; see Profiler.on_return
+
+    def to_json(self):
+        return {"name": self.name, "line": self.line, "calls": self.calls,
+                "inclusive": self.inclusive, "self": self.self_time,
+                "instances": self.instances, "environments": self.environments}
+
+# Per-function call counts, times and allocations for the Lox program, plus
+# how often each source line's statements ran. Functions are keyed by their
+# declaration, so every closure made from one declaration shares an entry.
+class Profiler(Hook):
+    def __init__(self):
+        self.functions = {}
+        self.lines = {}
+        self.script = FunctionStats("<script>", None)
+        self.stack = [[self.script, time.perf_counter(), 0.0]]     # [stats, start, time in callees]
+
+    def on_call(self, function, arguments):
+        declaration = function.declaration
+        stats = self.functions.get(declaration)
+        if stats is None:
+            stats = self.functions[declaration] = FunctionStats(function_name(function, arguments), first_line(declaration))
+        stats.calls += 1
+        stats.active += 1
+        self.stack.append([stats, time.perf_counter(), 0.0])
+
+    def on_return(self, function, value):
+        stats, start, callees = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        stats.active -= 1
+        stats.self_time += elapsed - callees
+        # A recursive call's time is already part of the outermost one
+        if not stats.active:
+            stats.inclusive += elapsed
+        self.stack[-1][2] += elapsed
+
+    def on_runtime_error(self, error):
+        self.unwind()
+
+    def unwind(self):
+        while len(self.stack) > 1:
+            self.on_return(None, None)
+
+    def on_statement(self, line):
+        self.lines[line] = self.lines.get(line, 0) + 1
+
+    def on_alloc(self, value):
+        stats = self.stack[-1][0]
+        if isinstance(value, LoxInstance):
+            stats.instances += 1
+        else:
+            stats.environments += 1
+
+    def finish(self):
+        self.unwind()
+        _, start, callees = self.stack[0]
+        self.script.inclusive = time.perf_counter() - start
+        self.script.self_time = self.script.inclusive - callees
+
+    def results(self):
+        return sorted([self.script, *self.functions.values()], key=lambda stats: stats.self_time, reverse=True)
+
+    def print_table(self, out):
+        out.write(f"{'function':<30} {'calls':>9} {'total ms':>10} {'self ms':>10} {'instances':>10} {'envs':>10}\n")
+        for stats in self.results():
+            name = stats.name if stats.line is None else f"{stats.name} (line {stats.line})"
+            out.write(f"{name:<30} {stats.calls:>9} {stats.inclusive * 1000:>10.2f} {stats.self_time * 1000:>10.2f} "
+                      f"{stats.instances:>10} {stats.environments:>10}\n")
+        out.write(f"\n{'line':>6} {'executed':>12}\n")
+        for line, count in sorted(self.lines.items(), key=lambda item: item[1], reverse=True)[:TOP_LINES]:
+            out.write(f"{line:>6} {count:>12}\n")
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump({"functions": [stats.to_json() for stats in self.results()],
+                       "lines": {str(line): count for line, count in sorted(self.lines.items())}}, f, indent=2)
@@ -1,18 +1,50 @@
+import pickle
 import sys
-from _token import Scanner, EOF
+import cache
+from functools import partial
+from _token import Scanner, RegexScanner, EOF
 from _parser import Parser
 from ast_printer import AstPrinter
+from optimizer import Optimizer
 from interpreter import Interpreter
 from resolver import Resolver
 from expr import Expr
+from vm import VM
+from closure_compiler import ClosureInterpreter
+from transpiler import PyInterpreter
+from profiler import Profiler
+
+ENGINES = {"tree": Interpreter, "vm": VM, "closure": ClosureInterpreter, "python": PyInterpreter}
+SCANNERS = {"char": Scanner, "regex": RegexScanner}
 
 had_error = False
 had_runtime_error = False
 interpreter = Interpreter()
+scanner_class = RegexScanner
+CHUNK_SIZE = 1 << 16
+optimize = False
+inline_budget = 16
+dump_ast = False
+
+def use_engine(name):
+    global interpreter
+    interpreter = ENGINES[name]()
+
+def use_profiler():
+    profiler = Profiler()
+    interpreter.add_hook(profiler)
+    return profiler
 
-def run_file(file):
+def use_scanner(name):
+    global scanner_class
+    scanner_class = SCANNERS[name]
+
+def run_file(file, stream=False):
     with open(file, 'r') as f:
-        run(f.read())
+        if stream:
+            run_stream(iter(partial(f.read, CHUNK_SIZE), ""))
+        else:
+            run(f.read())
     if had_error:
         sys.exit(2)
     if had_runtime_error:
@@ -23,9 +55,8 @@ def run_prompt():
     while 1:
         had_error = False
         line = input("> ")
-        scanner = Scanner(line)
-        tokens = scanner.scan_tokens()
-        parser = Parser(tokens)
+        scanner = scanner_class(line)
+        parser = Parser(scanner.scan())
         syntax = parser.parse_repl()
         if had_error:
             continue    # Ignore syntax errors
@@ -38,20 +69,74 @@ def run_prompt():
 
 
 def run(source):
-    scanner = Scanner(source)
-    tokens = scanner.scan_tokens()
-    parser = Parser(tokens)
+    if not dump_ast and interpreter.run_cached(source, options()):
+        return
+    statements = load_program(source)
+    if statements is None:
+        statements = compile_program(source)
+    if statements is None:
+        return
+    statements = optimize_program(statements)
+    if dump_ast:
+        print(AstPrinter().print_program(statements))
+        return
+    interpreter.interpret(statements)
+
+def options():
+    return f"optimize inline={inline_budget}" if optimize else ""
+
+def optimize_program(statements):
+    if optimize:
+        statements = Optimizer(interpreter, inline_budget).optimize(statements)
+    return statements
+
+def compile_program(source):
+    scanner = scanner_class(source)
+    parser = Parser(scanner.scan())
     statements = parser.parse()
     if had_error:
-        return
+        return None
     resolver = Resolver(interpreter)
     resolver.resolve(statements)
     if had_error:
-        return
-    interpreter.interpret(statements)
+        return None
+    store_program(source, statements)
+    return statements
+
+# Resolved programs are cached as pickled ASTs; resolution is stored on the
+# nodes themselves, so a loaded program is ready to run.
+def load_program(source):
+    return cache.load(cache.cache_key(source), ".loxc", pickle.load)
+
+def store_program(source, statements):
+    cache.store(cache.cache_key(source), ".loxc",
+                lambda f: pickle.dump(statements, f, pickle.HIGHEST_PROTOCOL))
+
+# Runs each top-level declaration as soon as it has been parsed and resolved,
+# so only one declaration's AST is alive at a time. Unlike run, statements
+# before a syntax error are executed; nothing runs after the first error.
+def run_stream(chunks):
+    parser = Parser(scanner_class("").scan_chunks(chunks))
+    resolver = Resolver(interpreter)
+    for statement in parser.declarations():
+        if had_error:
+            continue    # Keep parsing to report every syntax error
+        resolver.resolve([statement])
+        if had_error:
+            continue
+        statements = optimize_program([statement])
+        if dump_ast:
+            if statements:
+                print(AstPrinter().print_program(statements))
+            continue
+        interpreter.interpret(statements)
+        if had_runtime_error:
+            return
 
 def report(line, where, message):
     sys.stderr.write(f"[line {line}] Error{where}: {message}")
+    global had_error
+    had_error = True
 
 def error(token, message):
     if token.type == EOF:
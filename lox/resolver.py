@@ -1,4 +1,5 @@
 from collections import deque
+from expr import Call
 
 NONE = 0
 CLASS = 1
@@ -11,6 +12,7 @@ class Resolver:
     def __init__(self, interpreter):
         self.interpreter = interpreter
         self.scopes = deque()   # A generalized stack - We use append to push and pop to pop
+        self.uninitialized = deque()    # Names declared in each scope but not yet defined
         self.current_function = NONE
         self.current_class = NONE
     
@@ -36,16 +38,13 @@ class Resolver:
             self.current_class = SUBCLASS
             self.resolve(stmt.superclass)
             self.begin_scope()
-            self.scopes[-1]["super"] = True
+            self.scopes[-1]["super"] = 0
 
-        self.begin_scope()
-        self.scopes[-1]["this"] = True
         for method in stmt.methods:
             declaration = METHOD     # Method type
             if method.name.lexeme == "init":
                 declaration = INITIALIZER
             self.resolve_function(method.function, declaration)
-        self.end_scope()
         if stmt.superclass is not None:
             self.end_scope()
         self.current_class = enclosing_class
@@ -58,12 +57,12 @@ class Resolver:
     def visitFunctionStmt(self, stmt):
         self.declare(stmt.name)
         self.define(stmt.name)
-        self.resolve_function(stmt.function, self.current_function)
+        self.resolve_function(stmt.function, FUNCTION)
         return None
 
     def visitFunctionExpressionExpr(self, expr):
         # For anonymous functions
-        self.resolve_function(expr, self.current_function)
+        self.resolve_function(expr, FUNCTION)
 
 
     def visitIfStmt(self, stmt):
@@ -77,7 +76,7 @@ class Resolver:
         return None
 
     def visitReturnStmt(self, stmt):
-        if self.current_function is None:
+        if self.current_function == NONE:
             from pylox import error
             error(stmt.keyword, "Can't return from top level code.")
         if stmt.value is not None:
@@ -85,6 +84,8 @@ class Resolver:
                 from pylox import error
                 error(stmt.keyword, "Can't return a value from an initializer.")
             self.resolve(stmt.value)
+            # The caller's frame can be reused for a call whose result is returned as is
+            stmt.tail = isinstance(stmt.value, Call)
         return None
 
     def visitBreakStmt(self, stmt):
@@ -160,7 +161,7 @@ class Resolver:
         return None
 
     def visitVariableExpr(self, expr):
-        if not len(self.scopes) == 0 and self.scopes[-1].get(expr.name.lexeme) == False:
+        if not len(self.scopes) == 0 and expr.name.lexeme in self.uninitialized[-1]:
             from pylox import error
             error(expr.name, "Can't read local variable in its own initializer")
         self.resolve_local(expr, expr.name)
@@ -169,15 +170,18 @@ class Resolver:
     def declare(self, name):
         if len(self.scopes) == 0:
             return
-        if name in self.scopes[-1]:
+        scope = self.scopes[-1]
+        if name.lexeme in scope:
             from pylox import error
             error(name, "Already a variable with this name in this scope.")
-        self.scopes[-1][name.lexeme] = False
+            return
+        scope[name.lexeme] = len(scope)     # Slot in the scope's Environment
+        self.uninitialized[-1].add(name.lexeme)
     
     def define(self, name):
         if len(self.scopes) == 0:
             return
-        self.scopes[-1][name.lexeme] = True
+        self.uninitialized[-1].discard(name.lexeme)
     
     def resolve(self, stmt):
         if isinstance(stmt, list):
@@ -187,15 +191,18 @@ class Resolver:
             stmt.accept(self)
 
     def resolve_local(self, expr, name):
-        for i in range(len(self.scopes)):
-            if name.lexeme in self.scopes[i]:
-                self.interpreter.resolve(expr, len(self.scopes) - 1 - i)
+        for i in range(len(self.scopes) - 1, -1, -1):
+            slot = self.scopes[i].get(name.lexeme)
+            if slot is not None:
+                self.interpreter.resolve(expr, len(self.scopes) - 1 - i, slot)
                 return
 
     def resolve_function(self,function, current_function_type):
         enclosing_function_type = self.current_function
         self.current_function = current_function_type
         self.begin_scope()
+        if current_function_type in (METHOD, INITIALIZER):
+            self.scopes[-1]["this"] = 0     # The receiver is slot 0 of the method's frame
         for param in function.params:
             self.declare(param)
             self.define(param)
@@ -205,5 +212,7 @@ class Resolver:
 
     def begin_scope(self):
         self.scopes.append({})
+        self.uninitialized.append(set())
     def end_scope(self):
-        self.scopes.pop()
\ No newline at end of file
+        self.scopes.pop()
+        self.uninitialized.pop()
\ No newline at end of file
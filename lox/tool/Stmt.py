@@ -1,17 +1,22 @@
 from pylox import *
 class Stmt:
-	pass
+	__slots__ = ()
 
 class Visitor:
-	pass
+	__slots__ = ()
 class Block(Stmt):
+	__slots__ = ("statements", "unscoped")
+
 	def __init__(self,statements):
 		self.statements = statements
+		self.unscoped = None
 
 	def accept(self, visitor):
 		return visitor.visitBlockStmt(self)
 
 class Class(Stmt):
+	__slots__ = ("name", "superclass", "methods")
+
 	def __init__(self,name,superclass,methods):
 		self.name = name
 		self.superclass = superclass
@@ -21,13 +26,17 @@ class Class(Stmt):
 		return visitor.visitClassStmt(self)
 
 class Break(Stmt):
-	def __init__(self):
+	__slots__ = ()
+
+	def __init__(self,):
 		pass
 
 	def accept(self, visitor):
 		return visitor.visitBreakStmt(self)
 
 class Expression(Stmt):
+	__slots__ = ("expression",)
+
 	def __init__(self,expression):
 		self.expression = expression
 
@@ -35,6 +44,8 @@ class Expression(Stmt):
 		return visitor.visitExpressionStmt(self)
 
 class Function(Stmt):
+	__slots__ = ("name", "function")
+
 	def __init__(self,name,function):
 		self.name = name
 		self.function = function
@@ -43,6 +54,8 @@ class Function(Stmt):
 		return visitor.visitFunctionStmt(self)
 
 class If(Stmt):
+	__slots__ = ("condition", "then_branch", "else_branch")
+
 	def __init__(self,condition,then_branch,else_branch):
 		self.condition = condition
 		self.then_branch = then_branch
@@ -52,6 +65,8 @@ class If(Stmt):
 		return visitor.visitIfStmt(self)
 
 class Print(Stmt):
+	__slots__ = ("expression",)
+
 	def __init__(self,expression):
 		self.expression = expression
 
@@ -59,14 +74,19 @@ class Print(Stmt):
 		return visitor.visitPrintStmt(self)
 
 class Return(Stmt):
+	__slots__ = ("keyword", "value", "tail")
+
 	def __init__(self,keyword,value):
 		self.keyword = keyword
 		self.value = value
+		self.tail = None
 
 	def accept(self, visitor):
 		return visitor.visitReturnStmt(self)
 
 class Var(Stmt):
+	__slots__ = ("name", "initializer")
+
 	def __init__(self,name,initializer):
 		self.name = name
 		self.initializer = initializer
@@ -75,6 +95,8 @@ class Var(Stmt):
 		return visitor.visitVarStmt(self)
 
 class While(Stmt):
+	__slots__ = ("condition", "body")
+
 	def __init__(self,condition,body):
 		self.condition = condition
 		self.body = body
@@ -1,3 +1,4 @@
+import os
 import sys
 def main():
     if len(sys.argv) != 2:
@@ -5,43 +6,43 @@ def main():
         sys.exit(1)
     output_dir = sys.argv[1]
     define_ast(output_dir, "Expr", [
-      "Assign   : Token name, Expr value",
+      "Assign   : Token name, Expr value ; depth, slot",
       "Binary   : Expr left, Token operator, Expr right",
       "Call     : Expr callee, Token paren, list arguments",
-      "Get      : Expr object, Token name",
-      "Set      : Expr object, Token name, Expr value",
-      "Super    : Token keyword, Token method",
-      "This     : Token keyword",
+      "Get      : Expr object, Token name ; cached_shape, cached_offset, cached_class, cached_method, cache",
+      "Set      : Expr object, Token name, Expr value ; cached_shape, cached_offset, cached_next",
+      "Super    : Token keyword, Token method ; depth, slot",
+      "This     : Token keyword ; depth, slot",
       "Grouping : Expr expression",
       "Literal  : Object value",
       "Logical  : Expr left, Token operator, Expr right",
       "Unary    : Token operator, Expr right",
-      "Variable : Token name",
+      "Variable : Token name ; depth, slot",
       "FunctionExpression : list params, list body"
     ])
     define_ast(output_dir, "Stmt", [
-      "Block        : list statements",
+      "Block        : list statements ; unscoped",
       "Class        : Token name, Variable superclass, list methods",
       "Break        : ",
       "Expression   : Expr expression",
       "Function     : Token name, function function",
       "If           : Expr condition, Stmt then_branch, Stmt else_branch",
       "Print        : Expr expression",
-      "Return       : Token keyword, Expr value",
+      "Return       : Token keyword, Expr value ; tail",
       "Var          : Token name, Expr initializer",
       "While        : Expr condition, Stmt body"
     ])
 
 def define_ast(output_dir, base_name, types):
-    path = base_name + ".py"
+    path = os.path.join(output_dir, base_name + ".py")
     with open(path, "w") as f:
         print("from pylox import *", file=f)
         print(f"class {base_name}:", file=f)
-        print("\tpass", file=f)
+        print("\t__slots__ = ()", file=f)
         print("", file=f)
         # Visitor pattern
         print(f"class Visitor:", file=f)
-        print("\tpass", file=f)
+        print("\t__slots__ = ()", file=f)
         # Typr subsclasses
         for type in types:
             class_name = type.split(":")[0].strip()
@@ -49,17 +50,30 @@ def define_ast(output_dir, base_name, types):
             define_type(f, base_name, class_name, fields)
             print("", file=f)
 
+# Fields after a ';' are filled in by the Resolver or the interpreter rather
+# than the Parser, so they start out as None instead of being constructor
+# arguments.
 def define_type(file, base_name, class_name, field_list):
     print(f"class {class_name}({base_name}):", file=file)
+    field_list, _, resolved_list = field_list.partition(";")
+    field_list = field_list.strip()
     if field_list == "":
         fields = []
     else:
         fields = list(map(lambda s: s.split()[1],field_list.split(',')))
+    resolved = [field.strip() for field in resolved_list.split(',') if field.strip()]
+    slots = ", ".join(f'"{field}"' for field in fields + resolved)
+    if len(fields + resolved) == 1:
+        slots += ","
+    print(f"\t__slots__ = ({slots})", file=file)
+    print("", file=file)
     print(f"\tdef __init__(self,{','.join(fields)}):", file=file)
     for field in fields:
         print(f"\t\tself.{field} = {field}", file=file)
-    if len(fields) == 0:
-        print("\tpass", file=file)
+    for field in resolved:
+        print(f"\t\tself.{field} = None", file=file)
+    if len(fields + resolved) == 0:
+        print("\t\tpass", file=file)
     print("", file=file)
     print("\tdef accept(self, visitor):", file=file)
     print(f"\t\treturn visitor.visit{class_name}{base_name}(self)",file=file)
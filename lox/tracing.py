@@ -0,0 +1,163 @@
+from _token import Token
+from expr import Expr
+from stmt import Stmt, Block
+from callable import LoxFunction, LoxBoundMethod, LoxClass, LoxInstance
+from interpreter import Interpreter
+from _return import RETURN, TAIL_CALL
+
+# Callbacks for watching the tree-walker run a program; install one with
+# Interpreter.add_hook and override the events it needs.
+class Hook:
+    # A LoxFunction is about to run. Methods and initializers get their
+    # receiver as arguments[0]. A tail call returns from its caller, with
+    # value None, before the callee is called.
+    def on_call(self, function, arguments):
+        pass
+
+    def on_return(self, function, value):
+        pass
+
+    # A statement starting on 'line' is about to run.
+    def on_statement(self, line):
+        pass
+
+    # A LoxInstance, or the Environment for a call's frame or a block's scope,
+    # has been created.
+    def on_alloc(self, value):
+        pass
+
+    # A LoxRuntimeError has ended the program, or the REPL line, after
+    # unwinding every call still on the stack without an on_return.
+    def on_runtime_error(self, error):
+        pass
+
+# The line a node starts on: that of the first token it holds, if any.
+def first_line(node):
+    if isinstance(node, Token):
+        return node.line
+    for field in type(node).__slots__:
+        value = getattr(node, field)
+        for child in value if isinstance(value, list) else [value]:
+            if isinstance(child, (Token, Expr, Stmt)):
+                line = first_line(child)
+                if line is not None:
+                    return line
+    return None
+
+# How to name 'function' in a report: methods, which run with their receiver
+# in slot 0, as Class.method after the class that defines them.
+def function_name(function, arguments):
+    name = function.name or "<fn>"
+    if arguments and isinstance(arguments[0], LoxInstance):
+        klass = arguments[0].klass
+        while klass is not None and klass.methods.get(function.name) is not function:
+            klass = klass.superclass
+        if klass is not None:
+            name = f"{klass.name}.{name}"
+    return name
+
+# The tree-walker, calling hooks as it goes. Interpreter.add_hook switches an
+# interpreter to this class, and removing the last hook switches it back, so
+# an interpreter without hooks runs none of this code.
+class TracingInterpreter(Interpreter):
+    __slots__ = ()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+        if not self.hooks:
+            del self.hooks, self.statement_lines, self.functions
+            self.__class__ = Interpreter
+
+    def runtime_error(self, error):
+        del self.functions[:]
+        for hook in self.hooks:
+            hook.on_runtime_error(error)
+        super().runtime_error(error)
+
+    def execute(self, stmt):
+        line = self.statement_lines.get(stmt, 0)
+        if line == 0:
+            line = self.statement_lines[stmt] = None if type(stmt) is Block else first_line(stmt)
+        if line is not None:
+            for hook in self.hooks:
+                hook.on_statement(line)
+        return stmt.accept(self)
+
+    # Every block, and every call's body, runs in an environment of its own.
+    def execute_block(self, statements, environment):
+        for hook in self.hooks:
+            hook.on_alloc(environment)
+        previous = self.environment
+        try:
+            self.environment = environment
+            for statement in statements:
+                completion = self.execute(statement)
+                if completion is not None:
+                    return completion
+        finally:
+            self.environment = previous
+        return None
+
+    def visitBlockStmt(self, stmt):
+        if stmt.unscoped:
+            for statement in stmt.statements:
+                completion = self.execute(statement)
+                if completion is not None:
+                    return completion
+            return None
+        return super().visitBlockStmt(stmt)
+
+    # Tail calls to other Lox functions still go through LoxFunction.call's
+    # loop, so that tracing doesn't make deep tail recursion overflow.
+    def visitReturnStmt(self, stmt):
+        if not stmt.tail:
+            return super().visitReturnStmt(stmt)
+        callee, arguments = self.prepare_call(stmt.value)
+        if type(callee) is LoxBoundMethod:
+            callee, arguments = callee.method, [callee.receiver] + arguments
+        if type(callee) is not LoxFunction:
+            self.return_value = self.call(stmt.value, callee, arguments)
+            return RETURN
+        caller = self.functions[-1]
+        for hook in self.hooks:
+            hook.on_return(caller, None)
+        self.functions[-1] = callee
+        for hook in self.hooks:
+            hook.on_call(callee, arguments)
+        self.tail_call = callee, arguments
+        return TAIL_CALL
+
+    def visitCallExpr(self, expr):
+        callee, arguments = self.prepare_call(expr)
+        return self.call(expr, callee, arguments)
+
+    def apply(self, callee, arguments):
+        if type(callee) in (LoxFunction, LoxBoundMethod, LoxClass) and len(arguments) == callee.arity():
+            return self.call(None, callee, arguments)
+        return super().apply(callee, arguments)
+
+    def call(self, expr, callee, arguments):
+        kind = type(callee)
+        if kind is LoxClass:
+            instance = LoxInstance(callee)
+            for hook in self.hooks:
+                hook.on_alloc(instance)
+            initializer = callee.find_method("init")
+            if initializer is not None:
+                self.call(expr, initializer, [instance] + arguments)
+            return instance
+        if kind is LoxBoundMethod:
+            callee, arguments = callee.method, [callee.receiver] + arguments
+        elif kind is not LoxFunction:
+            return self.call_native(expr, callee, arguments)
+        for hook in self.hooks:
+            hook.on_call(callee, arguments)
+        self.functions.append(callee)
+        value = callee.call(self, arguments)
+        function = self.functions.pop()     # Not callee after a tail call
+        for hook in self.hooks:
+            hook.on_return(function, value)
+        return value
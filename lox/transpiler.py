@@ -0,0 +1,686 @@
+import functools
+import marshal
+import math
+import _token
+import cache
+from expr import *
+from stmt import *
+from interpreter import Interpreter, LoxRuntimeError
+from callable import LoxCallable, LoxClass, LoxInstance
+from vec import elementwise
+
+FILENAME = "<lox>"
+MAIN = "__lox_main__"
+
+class Cell:
+    # Holds a local that is captured by a nested function. A fresh Cell is
+    # created every time the declaration runs, so closures made in different
+    # loop iterations see different variables, as they do in the tree-walker.
+    __slots__ = ("v",)
+
+    def __init__(self, v):
+        self.v = v
+
+class TranspiledFunction(LoxCallable):
+    def __init__(self, name, fn, nparams, is_initializer):
+        self.name = name
+        self.fn = fn
+        self.nparams = nparams
+        self.is_initializer = is_initializer
+
+    def call(self, interpreter, arguments):
+        return self.fn(*arguments)
+
+    def arity(self):
+        return self.nparams
+
+    def __str__(self):
+        if self.name is None:
+            return "<fn>"
+        return "<fn " + self.name + ">"
+
+    def bind(self, instance, name):
+        return TranspiledFunction(name, functools.partial(self.fn, instance), self.nparams, self.is_initializer)
+
+class Local:
+    def __init__(self, name, owner):
+        self.name = name
+        self.owner = owner
+        self.captured = False
+
+def line_of(node):
+    # Statements don't carry a token, so use the first one found inside.
+    for attr in ("keyword", "name", "operator", "paren"):
+        token = getattr(node, attr, None)
+        if isinstance(token, _token.Token):
+            return token.line
+    for attr in ("expression", "initializer", "condition", "value", "left", "callee",
+                 "object", "right", "superclass", "statements", "then_branch", "body"):
+        child = getattr(node, attr, None)
+        if isinstance(child, list):
+            child = child[0] if child else None
+        if child is not None and not isinstance(child, _token.Token):
+            line = line_of(child)
+            if line is not None:
+                return line
+    return None
+
+class ScopeWalker(Visitor):
+    # Mirrors the scopes built by Resolver so that the depth it recorded for
+    # a variable picks out the same declaration here.
+    def __init__(self):
+        self.scopes = []
+        self.functions = [MAIN]
+
+    def walk(self, node):
+        if node is not None:
+            return node.accept(self)
+
+    def walk_all(self, nodes):
+        for node in nodes:
+            self.walk(node)
+
+    def distance(self, expr):
+        return expr.depth
+
+    def lookup(self, expr, name):
+        distance = self.distance(expr)
+        if distance is None:
+            return None
+        return self.scopes[-1 - distance][name]
+
+class CaptureAnalyzer(ScopeWalker):
+    def __init__(self):
+        super().__init__()
+        self.declared = {}
+        self.free = {}
+        self.count = 0
+
+    def declare(self, key, name):
+        if not self.scopes:
+            return None
+        self.count += 1
+        local = Local(f"{name}_{self.count}", self.functions[-1])
+        self.declared[key] = local
+        self.scopes[-1][name] = local
+        return local
+
+    def reference(self, expr, name):
+        local = self.lookup(expr, name)
+        if local is not None:
+            self.reference_local(local)
+
+    def reference_local(self, local):
+        if local.owner is self.functions[-1]:
+            return
+        local.captured = True
+        for function in reversed(self.functions):
+            if function is local.owner:
+                break
+            free = self.free.setdefault(function, [])
+            if local not in free:
+                free.append(local)
+
+    def function(self, function, method=False):
+        self.functions.append(function)
+        self.scopes.append({})
+        if method:
+            self.declare(("this", function), "this")
+        for param in function.params:
+            self.declare(param, param.lexeme)
+        self.walk_all(function.body)
+        self.scopes.pop()
+        self.functions.pop()
+
+    def visitBlockStmt(self, stmt):
+        if stmt.unscoped:
+            self.walk_all(stmt.statements)
+            return
+        self.scopes.append({})
+        self.walk_all(stmt.statements)
+        self.scopes.pop()
+
+    def visitClassStmt(self, stmt):
+        self.declare(stmt, stmt.name.lexeme)
+        self.walk(stmt.superclass)
+        if stmt.superclass is not None:
+            self.scopes.append({})
+            self.declare(("super", stmt), "super")
+        for method in stmt.methods:
+            self.function(method.function, method=True)
+        if stmt.superclass is not None:
+            self.scopes.pop()
+
+    def visitExpressionStmt(self, stmt):
+        self.walk(stmt.expression)
+
+    def visitFunctionStmt(self, stmt):
+        self.declare(stmt, stmt.name.lexeme)
+        self.function(stmt.function)
+
+    def visitFunctionExpressionExpr(self, expr):
+        self.function(expr)
+
+    def visitIfStmt(self, stmt):
+        self.walk(stmt.condition)
+        self.walk(stmt.then_branch)
+        self.walk(stmt.else_branch)
+
+    def visitPrintStmt(self, stmt):
+        self.walk(stmt.expression)
+
+    def visitReturnStmt(self, stmt):
+        self.walk(stmt.value)
+
+    def visitVarStmt(self, stmt):
+        self.declare(stmt, stmt.name.lexeme)
+        self.walk(stmt.initializer)
+
+    def visitWhileStmt(self, stmt):
+        self.walk(stmt.condition)
+        self.walk(stmt.body)
+
+    def visitBreakStmt(self, stmt):
+        pass
+
+    def visitAssignExpr(self, expr):
+        self.walk(expr.value)
+        self.reference(expr, expr.name.lexeme)
+
+    def visitBinaryExpr(self, expr):
+        self.walk(expr.left)
+        self.walk(expr.right)
+
+    def visitCallExpr(self, expr):
+        self.walk(expr.callee)
+        self.walk_all(expr.arguments)
+
+    def visitGetExpr(self, expr):
+        self.walk(expr.object)
+
+    def visitGroupingExpr(self, expr):
+        self.walk(expr.expression)
+
+    def visitLiteralExpr(self, expr):
+        pass
+
+    def visitLogicalExpr(self, expr):
+        self.walk(expr.left)
+        self.walk(expr.right)
+
+    def visitSetExpr(self, expr):
+        self.walk(expr.object)
+        self.walk(expr.value)
+
+    def visitSuperExpr(self, expr):
+        self.reference(expr, "super")
+        distance = self.distance(expr)
+        if distance is not None:
+            self.reference_local(self.scopes[-distance]["this"])
+
+    def visitThisExpr(self, expr):
+        self.reference(expr, "this")
+
+    def visitUnaryExpr(self, expr):
+        self.walk(expr.right)
+
+    def visitVariableExpr(self, expr):
+        self.reference(expr, expr.name.lexeme)
+
+BINARY_TEMPLATES = {
+    _token.MINUS: "({a} - {b} if type({a} := {left}) is type({b} := {right}) is float else _number('-', {a}, {b}))",
+    _token.STAR: "({a} * {b} if type({a} := {left}) is type({b} := {right}) is float else _number('*', {a}, {b}))",
+    _token.SLASH: "({a} / {b} if type({a} := {left}) is type({b} := {right}) is float else _number('/', {a}, {b}))",
+    _token.GREATER: "({a} > {b} if type({a} := {left}) is type({b} := {right}) is float else _number('>', {a}, {b}))",
+    _token.GREATER_EQUAL: "({a} >= {b} if type({a} := {left}) is type({b} := {right}) is float else _number('>=', {a}, {b}))",
+    _token.LESS: "({a} < {b} if type({a} := {left}) is type({b} := {right}) is float else _number('<', {a}, {b}))",
+    _token.LESS_EQUAL: "({a} <= {b} if type({a} := {left}) is type({b} := {right}) is float else _number('<=', {a}, {b}))",
+    _token.PLUS: "({a} + {b} if type({a} := {left}) is type({b} := {right}) in _ADDABLE else _add({a}, {b}))",
+    _token.EQUAL_EQUAL: "({left} == {right})",
+    _token.BANG_EQUAL: "({left} != {right})",
+}
+
+class Transpiler(ScopeWalker):
+    # Emits Python source for a resolved program. Lox locals become Python
+    # locals (or Cells, when a closure captures them), globals live in the
+    # dict G, and every emitted line remembers the Lox line it came from.
+    def __init__(self):
+        super().__init__()
+        self.analysis = None
+        self.lines = []
+        self.line_table = [0]
+        self.indent = 0
+        self.line = 0
+        self.temps = [0]
+        self.count = 0
+        self.initializers = set()
+
+    def transpile(self, statements):
+        self.analysis = CaptureAnalyzer()
+        self.analysis.walk_all(statements)
+        self.emit(f"def {MAIN}():")
+        self.suite(lambda: self.walk_all(statements))
+        return "\n".join(self.lines) + "\n", self.line_table
+
+    def transpile_expression(self, expr):
+        self.analysis = CaptureAnalyzer()
+        self.analysis.walk(expr)
+        self.emit(f"def {MAIN}():")
+        self.indent += 1
+        self.line = line_of(expr) or 0
+        self.emit(f"return {self.expression(expr)}")
+        self.indent -= 1
+        return "\n".join(self.lines) + "\n", self.line_table
+
+    def emit(self, text):
+        self.lines.append("    " * self.indent + text)
+        self.line_table.append(self.line)
+
+    def suite(self, body):
+        self.indent += 1
+        start = len(self.lines)
+        body()
+        if len(self.lines) == start:
+            self.emit("pass")
+        self.indent -= 1
+
+    def temp(self):
+        self.temps[-1] += 1
+        return f"_t{self.temps[-1]}"
+
+    def fresh(self, name):
+        self.count += 1
+        return f"_{name}_{self.count}"
+
+    def truthy(self, expr):
+        t = self.temp()
+        return f"(({t} := {self.expression(expr)}) is not None and {t} is not False)"
+
+    def expression(self, expr):
+        return expr.accept(self)
+
+    def statement(self, stmt):
+        if stmt is None:
+            return
+        line = line_of(stmt)
+        if line is not None:
+            self.line = line
+        stmt.accept(self)
+
+    def walk_all(self, statements):
+        for statement in statements:
+            self.statement(statement)
+
+    def declare(self, key, name):
+        if not self.scopes:
+            return None
+        local = self.analysis.declared[key]
+        self.scopes[-1][name] = local
+        return local
+
+    def read(self, local):
+        if local.captured:
+            return "c_" + local.name + ".v"
+        return local.name
+
+    def variable(self, expr, name):
+        local = self.lookup(expr, name)
+        if local is None:
+            return f"G[{name!r}]"
+        return self.read(local)
+
+    def bind(self, local, name, value):
+        # Statement that stores 'value' into a freshly declared variable.
+        if local is None:
+            self.emit(f"G[{name!r}] = {value}")
+        elif local.captured:
+            self.emit(f"c_{local.name} = Cell({value})")
+        else:
+            self.emit(f"{local.name} = {value}")
+
+    def predeclare(self, local):
+        # Captured variables get their Cell before the initializer runs so a
+        # closure in the initializer can refer to the variable itself.
+        if local is not None and local.captured:
+            self.emit(f"c_{local.name} = Cell(None)")
+
+    def store(self, local, name, value):
+        if local is None:
+            self.emit(f"G[{name!r}] = {value}")
+        elif local.captured:
+            self.emit(f"c_{local.name}.v = {value}")
+        else:
+            self.emit(f"{local.name} = {value}")
+
+    def function(self, function, name, is_initializer=False, method=False):
+        # Emits a nested def and returns its Python name. Captured variables
+        # from enclosing functions are passed in as keyword-only defaults so
+        # each evaluation of the declaration binds the current Cells.
+        py_name = self.fresh(name or "fn")
+        if is_initializer:
+            self.initializers.add(function)
+        self.functions.append(function)
+        self.temps.append(0)
+        params = []
+        this = None
+        self.scopes.append({})
+        if method:
+            this = self.declare(("this", function), "this")
+            params.append(this.name)
+        locals = [self.declare(param, param.lexeme) for param in function.params]
+        params.extend(local.name for local in locals)
+        free = self.analysis.free.get(function, [])
+        if free:
+            params.append("*")
+            params.extend(f"c_{local.name}=c_{local.name}" for local in free)
+        self.emit(f"def {py_name}({', '.join(params)}):")
+        def body():
+            for local in ([this] if this is not None else []) + locals:
+                if local.captured:
+                    self.emit(f"c_{local.name} = Cell({local.name})")
+            self.walk_all(function.body)
+            if is_initializer:
+                self.emit(f"return {self.read(this)}")
+        self.suite(body)
+        self.scopes.pop()
+        self.temps.pop()
+        self.functions.pop()
+        return py_name
+
+    def visitBlockStmt(self, stmt):
+        if stmt.unscoped:
+            self.walk_all(stmt.statements)
+            return
+        self.scopes.append({})
+        self.walk_all(stmt.statements)
+        self.scopes.pop()
+
+    def visitClassStmt(self, stmt):
+        superclass = "None"
+        if stmt.superclass is not None:
+            superclass = self.fresh("superclass")
+            self.emit(f"{superclass} = {self.expression(stmt.superclass)}")
+            self.emit(f"if not isinstance({superclass}, LoxClass): _error_superclass()")
+        local = self.declare(stmt, stmt.name.lexeme)
+        self.bind(local, stmt.name.lexeme, "None")
+        if stmt.superclass is not None:
+            self.scopes.append({})
+            super_local = self.declare(("super", stmt), "super")
+            self.bind(super_local, "super", superclass)
+        methods = []
+        for method in stmt.methods:
+            is_initializer = method.name.lexeme == "init"
+            py_name = self.function(method.function, method.name.lexeme, is_initializer, method=True)
+            methods.append(f"{method.name.lexeme!r}: TranspiledFunction({method.name.lexeme!r}, {py_name}, "
+                           f"{len(method.function.params)}, {is_initializer})")
+        if stmt.superclass is not None:
+            self.scopes.pop()
+        self.store(local, stmt.name.lexeme,
+                   f"LoxClass({stmt.name.lexeme!r}, {superclass}, {{{', '.join(methods)}}})")
+
+    def visitExpressionStmt(self, stmt):
+        expr = stmt.expression
+        if isinstance(expr, Assign):
+            local = self.lookup(expr, expr.name.lexeme)
+            if local is not None:
+                self.store(local, expr.name.lexeme, self.expression(expr.value))
+                return
+        self.emit(self.expression(expr))
+
+    def visitFunctionStmt(self, stmt):
+        local = self.declare(stmt, stmt.name.lexeme)
+        self.predeclare(local)
+        py_name = self.function(stmt.function, stmt.name.lexeme)
+        self.store(local, stmt.name.lexeme,
+                   f"TranspiledFunction({stmt.name.lexeme!r}, {py_name}, {len(stmt.function.params)}, False)")
+
+    def visitFunctionExpressionExpr(self, expr):
+        py_name = self.function(expr, None)
+        return f"TranspiledFunction(None, {py_name}, {len(expr.params)}, False)"
+
+    def visitIfStmt(self, stmt):
+        self.emit(f"if {self.truthy(stmt.condition)}:")
+        self.suite(lambda: self.statement(stmt.then_branch))
+        if stmt.else_branch is not None:
+            self.emit("else:")
+            self.suite(lambda: self.statement(stmt.else_branch))
+
+    def visitPrintStmt(self, stmt):
+        self.emit(f"_print({self.expression(stmt.expression)})")
+
+    def visitReturnStmt(self, stmt):
+        function = self.functions[-1]
+        if function in self.initializers:
+            self.emit(f"return {self.read(self.analysis.declared[('this', function)])}")
+        elif stmt.value is None:
+            self.emit("return None")
+        else:
+            self.emit(f"return {self.expression(stmt.value)}")
+
+    def visitVarStmt(self, stmt):
+        local = self.declare(stmt, stmt.name.lexeme)
+        if stmt.initializer is None:
+            self.bind(local, stmt.name.lexeme, "None")
+        elif local is not None and local.captured:
+            self.predeclare(local)
+            self.store(local, stmt.name.lexeme, self.expression(stmt.initializer))
+        else:
+            self.bind(local, stmt.name.lexeme, self.expression(stmt.initializer))
+
+    def visitWhileStmt(self, stmt):
+        self.emit(f"while {self.truthy(stmt.condition)}:")
+        self.suite(lambda: self.statement(stmt.body))
+
+    def visitBreakStmt(self, stmt):
+        self.emit("break")
+
+    def visitAssignExpr(self, expr):
+        value = self.expression(expr.value)
+        local = self.lookup(expr, expr.name.lexeme)
+        if local is None:
+            return f"_assign_global({expr.name.lexeme!r}, {value})"
+        if local.captured:
+            return f"_assign_cell(c_{local.name}, {value})"
+        return f"({local.name} := {value})"
+
+    def visitBinaryExpr(self, expr):
+        template = BINARY_TEMPLATES[expr.operator.type]
+        left = self.expression(expr.left)
+        right = self.expression(expr.right)
+        return template.format(a=self.temp(), b=self.temp(), left=left, right=right)
+
+    def visitCallExpr(self, expr):
+        callee = self.expression(expr.callee)
+        arguments = ", ".join(self.expression(argument) for argument in expr.arguments)
+        f = self.temp()
+        return (f"({f}.fn if type({f} := {callee}) is TranspiledFunction and {f}.nparams == {len(expr.arguments)} "
+                f"else _callable({f}))({arguments})")
+
+    def visitGetExpr(self, expr):
+        return f"_get({self.expression(expr.object)}, {expr.name.lexeme!r})"
+
+    def visitGroupingExpr(self, expr):
+        return f"({self.expression(expr.expression)})"
+
+    def visitLiteralExpr(self, expr):
+        value = expr.value
+        if isinstance(value, float) and not math.isfinite(value):
+            return f"float({repr(value)!r})"
+        return repr(value)
+
+    def visitLogicalExpr(self, expr):
+        t = self.temp()
+        left = self.expression(expr.left)
+        right = self.expression(expr.right)
+        if expr.operator.type == _token.OR:
+            return f"({t} if ({t} := {left}) is not None and {t} is not False else {right})"
+        return f"({right} if ({t} := {left}) is not None and {t} is not False else {t})"
+
+    def visitSetExpr(self, expr):
+        obj = self.expression(expr.object)
+        value = self.expression(expr.value)
+        return f"_set(_check_instance({obj}), {expr.name.lexeme!r}, {value})"
+
+    def visitSuperExpr(self, expr):
+        distance = self.distance(expr)
+        superclass = self.read(self.scopes[-1 - distance]["super"])
+        this = self.read(self.scopes[-distance]["this"])
+        return f"_super({superclass}, {this}, {expr.method.lexeme!r})"
+
+    def visitThisExpr(self, expr):
+        return self.variable(expr, "this")
+
+    def visitUnaryExpr(self, expr):
+        t = self.temp()
+        right = self.expression(expr.right)
+        if expr.operator.type == _token.MINUS:
+            return f"(-{t} if type({t} := {right}) is float else _error_operand())"
+        return f"(({t} := {right}) is None or {t} is False)"
+
+    def visitVariableExpr(self, expr):
+        return self.variable(expr, expr.name.lexeme)
+
+def runtime(interpreter):
+    # The namespace transpiled code runs in.
+    global_values = interpreter.globals.values
+
+    def _print(value):
+        print(interpreter.stringify(value))
+
+    def _call(callee, *arguments):
+        if not isinstance(callee, LoxCallable):
+            raise LoxRuntimeError(None, "Can only call functions and classes")
+        if len(arguments) != callee.arity():
+            raise LoxRuntimeError(None, f"Expected {callee.arity()} arguments but got {len(arguments)}.")
+        return callee.call(interpreter, list(arguments))
+
+    def _callable(callee):
+        return functools.partial(_call, callee)
+
+    def _get(obj, name):
+        if not isinstance(obj, LoxInstance):
+            raise LoxRuntimeError(None, "Only  instances have properties.")
+        offset = obj.shape.index.get(name)
+        if offset is not None:
+            return obj.values[offset]
+        method = obj.klass.find_method(name)
+        if method is None:
+            raise LoxRuntimeError(None, f"Undefined property {name}.")
+        return method.bind(obj, name)
+
+    def _check_instance(obj):
+        if not isinstance(obj, LoxInstance):
+            raise LoxRuntimeError(None, "Only instances have fields.")
+        return obj
+
+    def _set(obj, name, value):
+        obj.set_field(name, value)
+        return value
+
+    def _super(superclass, obj, name):
+        method = superclass.find_method(name)
+        if method is None:
+            raise LoxRuntimeError(None, f"undefined property '{name}'.")
+        return method.bind(obj, name)
+
+    def _assign_global(name, value):
+        if name not in global_values:
+            raise LoxRuntimeError(None, f"Undefined variable '{name}'.")
+        global_values[name] = value
+        return value
+
+    def _assign_cell(cell, value):
+        cell.v = value
+        return value
+
+    def _number(symbol, a, b):
+        return elementwise(symbol, a, b, None, "Operands must be a number")
+
+    def _add(a, b):
+        return elementwise("+", a, b, None, "Operands must be two numbers or two strings")
+
+    def _error_operand():
+        raise LoxRuntimeError(None, "Operand must be a number")
+
+    def _error_superclass():
+        raise LoxRuntimeError(None, "Superclass must be a class.")
+
+    namespace = {name: value for name, value in locals().items() if name.startswith("_")}
+    namespace.update(G=global_values, Cell=Cell, LoxClass=LoxClass,
+                     TranspiledFunction=TranspiledFunction, _ADDABLE=(float, str))
+    return namespace
+
+class PyInterpreter(Interpreter):
+    # Transpiles the resolved program to Python, compile()s it and lets
+    # CPython run it. Compiled programs are cached on disk by source hash.
+    def __init__(self):
+        super().__init__()
+        self.pending_key = None
+        self.line_tables = {}   # Lox line of every transpiled line, by code filename
+
+    def run_cached(self, source, options):
+        key = cache.cache_key(source, "transpiler", "optimizer", options=options)
+        cached = cache.load(key, ".loxpy", marshal.load)
+        if cached is None:
+            self.pending_key = key
+            return False
+        self.execute_code(*cached)
+        return True
+
+    def interpret(self, statements):
+        transpiler = Transpiler()
+        text, line_table = transpiler.transpile(statements)
+        code = compile(text, self.filename(), "exec")
+        if self.pending_key is not None:
+            cache.store(self.pending_key, ".loxpy", lambda f: marshal.dump((code, line_table), f))
+            self.pending_key = None
+        self.execute_code(code, line_table)
+
+    def interpret_expr(self, expr):
+        text, line_table = Transpiler().transpile_expression(expr)
+        try:
+            return self.stringify(self.run_code(compile(text, self.filename(), "exec"), line_table))
+        except LoxRuntimeError as error:
+            from pylox import runtimeError
+            runtimeError(error)
+            return None
+
+    def execute_code(self, code, line_table):
+        from pylox import runtimeError
+        try:
+            self.run_code(code, line_table)
+        except LoxRuntimeError as error:
+            runtimeError(error)
+
+    # Functions outlive the code that defined them (REPL lines, --stream), so
+    # each compiled program gets its own filename and line table.
+    def filename(self):
+        return f"{FILENAME[:-1]} {len(self.line_tables)}>"
+
+    def run_code(self, code, line_table):
+        self.line_tables[code.co_filename] = line_table
+        namespace = runtime(self)
+        exec(code, namespace)
+        try:
+            return namespace[MAIN]()
+        except LoxRuntimeError as error:
+            if error.token is None:
+                error.token = self.error_token(error.__traceback__)
+            raise
+        except KeyError as error:
+            token = self.error_token(error.__traceback__)
+            if token is None:
+                raise
+            raise LoxRuntimeError(token, f"Undefined variable '{error.args[0]}'.") from None
+
+    def error_token(self, traceback):
+        # The innermost frame of transpiled code points at the failing line.
+        line = None
+        while traceback is not None:
+            line_table = self.line_tables.get(traceback.tb_frame.f_code.co_filename)
+            if line_table is not None:
+                line = line_table[traceback.tb_lineno]
+            traceback = traceback.tb_next
+        if line is None:
+            return None
+        return _token.Token(_token.IDENTIFIER, "", None, line)
@@ -0,0 +1,126 @@
+import array
+import itertools
+import math
+import operator
+
+# NumPy takes longer to import than the whole interpreter, so it is only
+# imported once a program makes its first vector: see load_numpy.
+numpy = None
+numpy_loaded = False
+
+# Lox's numeric vector type: a fixed-length sequence of numbers in one
+# contiguous float64 buffer, a NumPy array when NumPy is installed and a
+# memoryview of an array('d') when it isn't. Arithmetic and comparisons with
+# a vector operand run over the whole buffer at once. A vector never changes
+# once made, so slices share their buffer with it, and == compares identity,
+# as it does for lists.
+class LoxVec:
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        from interpreter import stringify
+        return "vec[" + ", ".join(map(stringify, self.data.tolist())) + "]"
+
+# Division by zero gives an infinity or NaN, as it does in NumPy, rather than
+# failing part way through a vector.
+def divide(a, b):
+    try:
+        return a / b
+    except ZeroDivisionError:
+        if a == 0 or a != a:
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+OPERATORS = {"+": operator.add, "-": operator.sub, "*": operator.mul, "/": operator.truediv,
+             ">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+FALLBACK_OPERATORS = dict(OPERATORS, **{"/": divide})
+
+# NumPy, or None if it isn't installed. Every vector is made by one of the
+# functions below, which call this first, so code that has a vector in hand
+# can test the global instead.
+def load_numpy():
+    global numpy, numpy_loaded
+    if not numpy_loaded:
+        numpy_loaded = True
+        try:
+            import numpy
+        except ImportError:
+            pass
+    return numpy
+
+def make(values):
+    if load_numpy() is not None:
+        return LoxVec(numpy.fromiter(values, numpy.float64))
+    return LoxVec(memoryview(array.array("d", values)))
+
+def zeros(count):
+    if load_numpy() is not None:
+        return LoxVec(numpy.zeros(count))
+    return LoxVec(memoryview(array.array("d", bytes(8 * count))))
+
+def arange(count):
+    if load_numpy() is not None:
+        return LoxVec(numpy.arange(count, dtype=numpy.float64))
+    return LoxVec(memoryview(array.array("d", range(count))))
+
+# A view of elements 'start' up to 'end', sharing the vector's buffer.
+def view(vec, start, end):
+    return LoxVec(vec.data[start:end])
+
+# The vector's elements as floats, for Lox code to see.
+def elements(vec):
+    return vec.data.tolist()
+
+def total(vec):
+    if numpy is not None:
+        return float(vec.data.sum())
+    return float(sum(vec.data))
+
+def smallest(vec):
+    if numpy is not None:
+        return float(vec.data.min())
+    return float(min(vec.data))
+
+def largest(vec):
+    if numpy is not None:
+        return float(vec.data.max())
+    return float(max(vec.data))
+
+def dot(a, b):
+    if numpy is not None:
+        return float(numpy.dot(a.data, b.data))
+    return float(sum(map(operator.mul, a.data, b.data)))
+
+# 'left symbol right' where either operand is a vector and the other a vector
+# of the same length or a number; comparisons give 1 where they hold and 0
+# where they don't. Otherwise fails with 'message', at 'token'.
+def elementwise(symbol, left, right, token, message):
+    from interpreter import LoxRuntimeError
+    if type(left) is LoxVec:
+        a = left.data
+        if type(right) is LoxVec:
+            b = right.data
+            if len(a) != len(b):
+                raise LoxRuntimeError(token, f"Operands must be vectors of the same length, not {len(a)} and {len(b)}.")
+        elif type(right) is float:
+            b = right
+        else:
+            raise LoxRuntimeError(token, message)
+    elif type(left) is float and type(right) is LoxVec:
+        a, b = left, right.data
+    else:
+        raise LoxRuntimeError(token, message)
+
+    if numpy is not None:
+        with numpy.errstate(all="ignore"):
+            result = OPERATORS[symbol](a, b)
+        return LoxVec(result.astype(numpy.float64, copy=False))
+    function = FALLBACK_OPERATORS[symbol]
+    if type(a) is float:
+        a = itertools.repeat(a)
+    elif type(b) is float:
+        b = itertools.repeat(b)
+    return LoxVec(memoryview(array.array("d", map(function, a, b))))
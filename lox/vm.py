@@ -0,0 +1,341 @@
+from compiler import *
+from interpreter import Interpreter, LoxRuntimeError
+from callable import LoxCallable, LoxBoundMethod, LoxClass, LoxInstance
+from environment import Environment
+from vec import elementwise
+
+class VMFunction(LoxCallable):
+    def __init__(self, proto, closure, is_initializer):
+        self.name = proto.name
+        self.proto = proto
+        self.closure = closure
+        self.is_initializer = is_initializer
+
+    def call(self, vm, arguments):
+        return vm.call_function(self, arguments)
+
+    def arity(self):
+        return self.proto.arity
+
+    def __str__(self):
+        if self.name is None:
+            return "<fn>"
+        return "<fn " + self.name + ">"
+
+    def bind(self, instance, name):
+        return LoxBoundMethod(self, instance)
+
+class VM(Interpreter):
+    # Runs programs compiled by compiler.Compiler. Values, environments,
+    # classes and instances are shared with the tree-walking Interpreter, so
+    # the two engines agree on semantics; only the dispatch differs.
+    #
+    # Calls to Lox functions, methods and initializers don't recurse in
+    # Python: run saves the caller's chunk, ip and environment on self.frames
+    # and carries on with the callee, whose operands go on the same stack.
+    # Recursion is bounded by memory and max_depth, not the Python stack.
+    max_depth = 100000
+
+    def __init__(self):
+        super().__init__()
+        self.frames = []
+
+    def interpret(self, statements):
+        from pylox import runtimeError
+        proto = Compiler().compile(statements)
+        try:
+            self.run(proto.chunk, self.globals)
+        except LoxRuntimeError as error:
+            del self.frames[:]
+            runtimeError(error)
+
+    def interpret_expr(self, expr):
+        proto = Compiler().compile_expression(expr)
+        try:
+            return self.stringify(self.run(proto.chunk, self.globals))
+        except LoxRuntimeError as error:
+            del self.frames[:]
+            from pylox import runtimeError
+            runtimeError(error)
+            return None
+
+    def call_function(self, function, arguments):
+        result = self.run(function.proto.chunk, Environment(function.closure, arguments))
+        if function.is_initializer:
+            return arguments[0]
+        return result
+
+    # Functions called from Python, rather than by OP_CALL, get a run of
+    # their own, which returns when its first frame does.
+    def run(self, chunk, environment):
+        code = chunk.code
+        constants = chunk.constants
+        global_values = self.globals.values
+        frames = self.frames
+        base = len(frames)
+        receiver = None     # What the running initializer returns
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        ip = 0
+        while True:
+            op = code[ip]
+            if op == OP_GET_LOCAL:
+                depth = code[ip + 1]
+                e = environment
+                while depth:
+                    e = e.enclosing
+                    depth -= 1
+                push(e.values[code[ip + 2]])
+                ip += 3
+            elif op == OP_CONSTANT:
+                push(constants[code[ip + 1]])
+                ip += 2
+            elif op == OP_GET_GLOBAL:
+                name = constants[code[ip + 1]]
+                ip += 2
+                try:
+                    push(global_values[name.lexeme])
+                except KeyError:
+                    raise LoxRuntimeError(name, f"Undefined variable '{name.lexeme}'.")
+            elif op == OP_POP_JUMP_IF_FALSE:
+                value = pop()
+                if value is None or value is False:
+                    ip = code[ip + 1]
+                else:
+                    ip += 2
+            elif op == OP_JUMP:
+                ip = code[ip + 1]
+            elif op == OP_POP:
+                pop()
+                ip += 1
+            elif op == OP_ADD:
+                right = pop()
+                left = stack[-1]
+                if (type(left) is float and type(right) is float) or \
+                        (type(left) is str and type(right) is str):
+                    stack[-1] = left + right
+                else:
+                    stack[-1] = elementwise("+", left, right, constants[code[ip + 1]],
+                                            "Operands must be two numbers or two strings")
+                ip += 2
+            elif op == OP_SUBTRACT:
+                right = pop()
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left - right
+                else:
+                    stack[-1] = elementwise("-", left, right, constants[code[ip + 1]], "Operands must be a number")
+                ip += 2
+            elif op == OP_LESS:
+                right = pop()
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left < right
+                else:
+                    stack[-1] = elementwise("<", left, right, constants[code[ip + 1]], "Operands must be a number")
+                ip += 2
+            elif op == OP_CALL:
+                argc = code[ip + 1]
+                if argc:
+                    arguments = stack[-argc:]
+                    del stack[-argc:]
+                else:
+                    arguments = []
+                callee = pop()
+                kind = type(callee)
+                if kind is LoxBoundMethod and type(callee.method) is VMFunction:
+                    arguments.insert(0, callee.receiver)
+                    callee = callee.method
+                    kind = VMFunction
+                elif kind is LoxClass:
+                    initializer = callee.find_method("init")
+                    if type(initializer) is VMFunction:
+                        arguments.insert(0, LoxInstance(callee))
+                        callee = initializer
+                        kind = VMFunction
+                if kind is VMFunction:
+                    if argc != callee.proto.arity:
+                        raise LoxRuntimeError(constants[code[ip + 2]], f"Expected {callee.proto.arity} arguments but got {argc}.")
+                    if len(frames) - base >= self.max_depth:
+                        raise LoxRuntimeError(constants[code[ip + 2]], "Stack overflow.")
+                    frames.append((code, constants, ip + 3, environment, receiver))
+                    receiver = arguments[0] if callee.is_initializer else None
+                    chunk = callee.proto.chunk
+                    code = chunk.code
+                    constants = chunk.constants
+                    environment = Environment(callee.closure, arguments)
+                    ip = 0
+                else:
+                    if not isinstance(callee, LoxCallable):
+                        raise LoxRuntimeError(constants[code[ip + 2]], "Can only call functions and classes")
+                    if argc != callee.arity():
+                        raise LoxRuntimeError(constants[code[ip + 2]], f"Expected {callee.arity()} arguments but got {argc}.")
+                    try:
+                        push(callee.call(self, arguments))
+                    except LoxRuntimeError as error:
+                        if error.token is None:
+                            error.token = constants[code[ip + 2]]   # Raised by a native; see natives.error
+                        raise
+                    ip += 3
+            elif op == OP_RETURN:
+                value = pop()
+                if receiver is not None:
+                    value = receiver
+                if len(frames) == base:
+                    return value
+                code, constants, ip, environment, receiver = frames.pop()
+                push(value)
+            elif op == OP_SET_LOCAL:
+                depth = code[ip + 1]
+                e = environment
+                while depth:
+                    e = e.enclosing
+                    depth -= 1
+                e.values[code[ip + 2]] = stack[-1]
+                ip += 3
+            elif op == OP_DEFINE_LOCAL:
+                environment.values.append(pop())
+                ip += 1
+            elif op == OP_DEFINE_GLOBAL:
+                global_values[constants[code[ip + 1]]] = pop()
+                ip += 2
+            elif op == OP_PUSH_SCOPE:
+                environment = Environment(environment)
+                ip += 1
+            elif op == OP_POP_SCOPE:
+                environment = environment.enclosing
+                ip += 1
+            elif op == OP_GET_PROPERTY:
+                obj = stack[-1]
+                if not isinstance(obj, LoxInstance):
+                    raise LoxRuntimeError(constants[code[ip + 1]], "Only  instances have properties.")
+                stack[-1] = obj.get(constants[code[ip + 1]])
+                ip += 2
+            elif op == OP_NIL:
+                push(None)
+                ip += 1
+            elif op == OP_TRUE:
+                push(True)
+                ip += 1
+            elif op == OP_FALSE:
+                push(False)
+                ip += 1
+            elif op == OP_MULTIPLY:
+                right = pop()
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left * right
+                else:
+                    stack[-1] = elementwise("*", left, right, constants[code[ip + 1]], "Operands must be a number")
+                ip += 2
+            elif op == OP_DIVIDE:
+                right = pop()
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left / right
+                else:
+                    stack[-1] = elementwise("/", left, right, constants[code[ip + 1]], "Operands must be a number")
+                ip += 2
+            elif op == OP_GREATER:
+                right = pop()
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left > right
+                else:
+                    stack[-1] = elementwise(">", left, right, constants[code[ip + 1]], "Operands must be a number")
+                ip += 2
+            elif op == OP_GREATER_EQUAL:
+                right = pop()
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left >= right
+                else:
+                    stack[-1] = elementwise(">=", left, right, constants[code[ip + 1]], "Operands must be a number")
+                ip += 2
+            elif op == OP_LESS_EQUAL:
+                right = pop()
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left <= right
+                else:
+                    stack[-1] = elementwise("<=", left, right, constants[code[ip + 1]], "Operands must be a number")
+                ip += 2
+            elif op == OP_EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] == right
+                ip += 2
+            elif op == OP_NOT_EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] != right
+                ip += 2
+            elif op == OP_NOT:
+                value = stack[-1]
+                stack[-1] = value is None or value is False
+                ip += 1
+            elif op == OP_NEGATE:
+                if type(stack[-1]) is not float:
+                    raise LoxRuntimeError(constants[code[ip + 1]], "Operand must be a number")
+                stack[-1] = -stack[-1]
+                ip += 2
+            elif op == OP_JUMP_IF_FALSE:
+                value = stack[-1]
+                if value is None or value is False:
+                    ip = code[ip + 1]
+                else:
+                    ip += 2
+            elif op == OP_JUMP_IF_TRUE:
+                value = stack[-1]
+                if value is None or value is False:
+                    ip += 2
+                else:
+                    ip = code[ip + 1]
+            elif op == OP_PRINT:
+                print(self.stringify(pop()))
+                ip += 1
+            elif op == OP_SET_GLOBAL:
+                self.globals.assign(constants[code[ip + 1]], stack[-1])
+                ip += 2
+            elif op == OP_CHECK_INSTANCE:
+                if not isinstance(stack[-1], LoxInstance):
+                    raise LoxRuntimeError(constants[code[ip + 1]], "Only instances have fields.")
+                ip += 2
+            elif op == OP_SET_PROPERTY:
+                value = pop()
+                stack[-1].set(constants[code[ip + 1]], value)
+                stack[-1] = value
+                ip += 2
+            elif op == OP_GET_SUPER:
+                depth = code[ip + 1]
+                method_name = constants[code[ip + 2]]
+                superclass = environment.get_at(depth, 0)
+                obj = environment.get_at(depth - 1, 0)
+                method = superclass.find_method(method_name.lexeme)
+                if method is None:
+                    raise LoxRuntimeError(method_name, f"undefined property '{method_name.lexeme}'.")
+                push(method.bind(obj, method_name.lexeme))
+                ip += 3
+            elif op == OP_CLOSURE:
+                push(VMFunction(constants[code[ip + 1]], environment, False))
+                ip += 2
+            elif op == OP_CLASS:
+                count = code[ip + 2]
+                methods = {}
+                if count:
+                    for method in stack[-count:]:
+                        method.is_initializer = method.name == "init"
+                        methods[method.name] = method
+                    del stack[-count:]
+                superclass = environment.values[0] if code[ip + 3] else None
+                push(LoxClass(constants[code[ip + 1]], superclass, methods))
+                ip += 4
+            elif op == OP_CHECK_SUPERCLASS:
+                if not isinstance(stack[-1], LoxClass):
+                    raise LoxRuntimeError(constants[code[ip + 1]], "Superclass must be a class.")
+                ip += 2
+            elif op == OP_SET_LAST_LOCAL:
+                # A local class statement fills in its own, most recently defined, slot
+                environment.values[-1] = pop()
+                ip += 1
+            else:
+                raise RuntimeError(f"Unknown opcode {op}")
@@ -0,0 +1,128 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Runs the Lox programs in this directory on every engine, with and without
+# --optimize, --stream and (on the tree engine) --profile, and checks what
+# they print against the expectations written in them:
+#
+#   python tests/run.py [--engine vm] [name ...]
+#
+#   print 1 + 2;        // expect: 3
+#   a - nil;            // expect runtime error: Operands must be a number
+#
+# A runtime error is expected at the line of its comment. A program that
+# starts with '// engines: tree vm' only runs on those engines. All runs
+# share one cache directory, and the plain and --optimize runs are repeated
+# so that the second of them loads the program from the cache.
+HERE = os.path.dirname(os.path.abspath(__file__))
+LOX = os.path.join(os.path.dirname(HERE), "lox")
+ENGINES = ["tree", "vm", "closure", "python"]
+FLAGS = [[], ["--optimize"], ["--stream"]]
+TREE_FLAGS = [["--profile"], ["--optimize", "--profile"]]
+CACHED = [[], ["--optimize"]]
+
+EXPECT = re.compile(r"// expect: ?(.*)")
+EXPECT_ERROR = re.compile(r"// expect runtime error: (.+)")
+ENGINES_LINE = re.compile(r"// engines: (.+)")
+# Where --profile's report starts, after anything the program wrote to stderr
+PROFILE_TABLE = re.compile(r"function +calls ")
+
+class Test:
+    def __init__(self, name):
+        self.name = name
+        self.path = os.path.join(HERE, name + ".lox")
+        self.output = []
+        self.error = ""
+        self.status = 0
+        self.engines = ENGINES
+        with open(self.path) as f:
+            for line, text in enumerate(f, 1):
+                match = ENGINES_LINE.match(text)
+                if match and line == 1:
+                    self.engines = match.group(1).split()
+                match = EXPECT.search(text)
+                if match:
+                    self.output.append(match.group(1))
+                match = EXPECT_ERROR.search(text)
+                if match:
+                    self.error = f"{match.group(1)}\n[line {line}]"
+                    self.status = 3
+
+    # The runs to make, as (engine, flags); with 'cached', the ones to repeat
+    # once the cache is filled
+    def configurations(self, engines, cached=False):
+        for engine in engines:
+            if engine in self.engines:
+                if cached:
+                    yield from ((engine, flags) for flags in CACHED)
+                else:
+                    yield from ((engine, flags) for flags in FLAGS + (TREE_FLAGS if engine == "tree" else []))
+
+    # What's wrong with one run, or None
+    def check(self, engine, flags, cache_dir):
+        command = [sys.executable, LOX, f"--engine={engine}"] + flags
+        if "--profile" in flags:
+            command.append("--profile-output=" + os.path.join(cache_dir, f"{self.name}-{engine}.json"))
+        env = dict(os.environ, LOX_CACHE_DIR=cache_dir)
+        try:
+            result = subprocess.run(command + [self.path], capture_output=True, text=True, env=env, timeout=120)
+        except subprocess.TimeoutExpired:
+            return "timed out"
+        error = result.stderr
+        if "--profile" in flags:
+            table = PROFILE_TABLE.search(error)
+            error = error[:table.start()] if table else error
+        output = result.stdout.splitlines()
+        if output != self.output:
+            return f"printed:\n{indent(output)}\nexpected:\n{indent(self.output)}"
+        if error.strip() != self.error:
+            return f"reported:\n{indent(error.strip().splitlines())}\nexpected:\n{indent(self.error.splitlines())}"
+        if result.returncode != self.status:
+            return f"exited with {result.returncode}, expected {self.status}"
+        return None
+
+def indent(lines):
+    return "\n".join("    " + line for line in lines) or "    (nothing)"
+
+def available():
+    return sorted(name[:-len(".lox")] for name in os.listdir(HERE) if name.endswith(".lox"))
+
+def main():
+    parser = argparse.ArgumentParser(prog="tests/run.py")
+    parser.add_argument("names", nargs="*", metavar="name", help="tests to run (default: all of them)")
+    parser.add_argument("--engine", choices=ENGINES, action="append",
+                        help="only run on this engine (may be repeated; default: all of them)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="runs to make at once")
+    args = parser.parse_args()
+    names = args.names or available()
+    unknown = sorted(set(names) - set(available()))
+    if unknown:
+        parser.error(f"no such test: {', '.join(unknown)}")
+
+    tests = [Test(name) for name in names]
+    engines = args.engine or ENGINES
+    failures = 0
+    runs = 0
+    with tempfile.TemporaryDirectory(prefix="lox-tests-") as cache_dir, \
+            ThreadPoolExecutor(args.jobs) as pool:
+        # The first pass fills the cache that the second one reads
+        for cached in (False, True):
+            futures = [(test, engine, flags, pool.submit(test.check, engine, flags, cache_dir))
+                       for test in tests for engine, flags in test.configurations(engines, cached)]
+            for test, engine, flags, future in futures:
+                runs += 1
+                problem = future.result()
+                if problem is not None:
+                    failures += 1
+                    print(f"FAIL {test.name} --engine={engine} {' '.join(flags)}{' (cached)' if cached else ''}\n{problem}")
+    print(f"{runs - failures} of {runs} runs passed")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()